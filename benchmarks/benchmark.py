@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+
+from __future__ import annotations
+from argparse import ArgumentDefaultsHelpFormatter
+from asyncio import StreamReader, run as asyncio_run
+from dataclasses import dataclass
+from gc import collect as gc_collect
+from inspect import iscoroutinefunction
+from json import loads as json_loads, dumps as json_dumps
+from pathlib import Path
+from statistics import median, quantiles
+from sys import exit as sys_exit, getallocatedblocks
+from time import perf_counter_ns
+from tracemalloc import start as tracemalloc_start, stop as tracemalloc_stop, get_traced_memory, reset_peak
+from typing import Final, Callable, Awaitable, Type, Optional, Any, Union
+
+from typed_argument_parser import TypedArgumentParser
+
+from icap_server.structures.icap_request import ICAPRequest
+from icap_server.structures.icap_request_line import ICAPRequestLine
+from icap_server.structures.icap_response import ICAPResponse
+from icap_server.structures.headers import Headers
+
+BENCHMARKS_DIRECTORY: Final[Path] = Path(__file__).resolve().parent
+CORPUS_DIRECTORY: Final[Path] = BENCHMARKS_DIRECTORY / 'corpus'
+BASELINE_PATH: Final[Path] = BENCHMARKS_DIRECTORY / 'baseline.json'
+
+# The limit on decoded response bodies with which the decoding of content-encoded bodies is benchmarked.
+MAX_DECODED_BODY_SIZE: Final[int] = 10 * 1024 * 1024
+
+# A header block that the reference operation parses with plain byte string operations.
+REFERENCE_HEADER_BLOCK: Final[bytes] = (
+    b'Host: 127.0.0.1:1344\r\n'
+    b'Date: Mon, 19 Oct 2026 12:00:00 GMT\r\n'
+    b'Encapsulated: req-hdr=0, null-body=412\r\n'
+    b'Preview: 0\r\n'
+    b'Allow: 204, trailers\r\n'
+    b'X-Client-IP: 192.0.2.10\r\n'
+    b'\r\n'
+)
+
+Operation = Union[Callable[[], Any], Callable[[], Awaitable[Any]]]
+
+
+@dataclass(slots=True)
+class CorpusMessage:
+    """
+    A recorded ICAP request, split into the parts that the parser consumes separately.
+    """
+
+    name: str
+    request_line: bytes
+    header_block: bytes
+    encapsulated_block: bytes
+    request: ICAPRequest
+
+    @classmethod
+    async def from_path(cls, path: Path) -> CorpusMessage:
+        data: bytes = path.read_bytes()
+
+        request_line, _, rest = data.partition(b'\r\n')
+        header_block_end: int = rest.index(b'\r\n\r\n') + 4 if not rest.startswith(b'\r\n') else 2
+
+        reader = StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+
+        return cls(
+            name=path.stem,
+            request_line=request_line + b'\r\n',
+            header_block=rest[:header_block_end],
+            encapsulated_block=rest[header_block_end:],
+            request=await ICAPRequest.from_reader(reader=reader)
+        )
+
+
+@dataclass(slots=True)
+class BenchmarkResult:
+    ns_per_op: float
+    # The time relative to that of the reference operation, measured in alternation with it.
+    relative_cost: float
+    # The interquartile range of the repeats' relative costs, relative to their median.
+    spread: float
+    peak_bytes_per_op: float
+    # The number of memory blocks that an operation leaves allocated, including those of its result.
+    allocated_blocks_per_op: float
+
+
+def _make_reader(data: bytes) -> StreamReader:
+    reader = StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+def reference_operation() -> dict[bytes, bytes]:
+    """
+    Parse a header block with plain byte string operations, independently of the code under test.
+
+    The time of the benchmarks relative to this operation, measured in alternation with them, is compared with the
+    baseline, so that the comparison is insensitive to the speed of the machine and to its load during the run.
+
+    :return: A map of lowercase header names to values.
+    """
+
+    return {
+        name.lower(): value
+        for name, _, value in (
+            header_line.partition(b': ') for header_line in REFERENCE_HEADER_BLOCK.split(b'\r\n') if header_line
+        )
+    }
+
+
+def make_benchmarks(message: CorpusMessage) -> dict[str, Operation]:
+    """
+    Make the benchmarks of the hot functions for a corpus message.
+
+    Each benchmark is a function performing one operation. Operations on a `StreamReader` are coroutine functions and
+    include the creation and feeding of an in-memory reader; the other operations are called directly.
+
+    :param message: A recorded ICAP request.
+    :return: A map of benchmark names to operations.
+    """
+
+    request: ICAPRequest = message.request
+    method = request.request_line.method
+    encapsulated_header_values: Optional[list[bytes]] = request.headers.get(b'encapsulated')
+    response: ICAPResponse = ICAPResponse.make(
+        method=method,
+        encapsulated_data=request.body,
+        status_code=200,
+        headers=Headers(),
+        istag=b'benchmark'
+    )
+
+    def request_line_from_bytes():
+        return ICAPRequestLine.from_bytes(data=message.request_line)
+
+    async def read_icap_headers():
+        return await ICAPRequest._read_icap_headers(reader=_make_reader(data=message.header_block))
+
+    def parse_encapsulated_header():
+        return ICAPRequest._parse_encapsulated_header(
+            encapsulated_header_values=encapsulated_header_values,
+            method=method
+        )
+
+    async def read_encapsulated_data():
+        return await ICAPRequest._read_encapsulated_data(
+            reader=_make_reader(data=message.encapsulated_block),
+            method=method,
+            encapsulated_header_values=encapsulated_header_values
+        )
+
+    async def read_decoded_encapsulated_data():
+        return await ICAPRequest._read_encapsulated_data(
+            reader=_make_reader(data=message.encapsulated_block),
+            method=method,
+            encapsulated_header_values=encapsulated_header_values,
+            max_decoded_body_size=MAX_DECODED_BODY_SIZE
+        )
+
+    def response_make():
+        return ICAPResponse.make(
+            method=method,
+            encapsulated_data=request.body,
+            status_code=200,
+            headers=Headers(),
+            istag=b'benchmark'
+        )
+
+    def response_bytes():
+        return bytes(response)
+
+    return {
+        f'ICAPRequestLine.from_bytes[{message.name}]': request_line_from_bytes,
+        f'ICAPRequest._read_icap_headers[{message.name}]': read_icap_headers,
+        f'ICAPRequest._parse_encapsulated_header[{message.name}]': parse_encapsulated_header,
+        f'ICAPRequest._read_encapsulated_data[{message.name}]': read_encapsulated_data,
+        f'ICAPRequest._read_encapsulated_data(max_decoded_body_size)[{message.name}]': read_decoded_encapsulated_data,
+        f'ICAPResponse.make[{message.name}]': response_make,
+        f'bytes(ICAPResponse)[{message.name}]': response_bytes,
+    }
+
+
+async def _time_ops(operation: Operation, num_ops: int) -> float:
+    if iscoroutinefunction(operation):
+        start_ns = perf_counter_ns()
+        for _ in range(num_ops):
+            await operation()
+    else:
+        start_ns = perf_counter_ns()
+        for _ in range(num_ops):
+            operation()
+
+    return (perf_counter_ns() - start_ns) / num_ops
+
+
+async def measure(operation: Operation, num_ops: int, num_repeats: int, repeat_duration: float) -> BenchmarkResult:
+    """
+    Measure the time, the peak memory, and the allocated memory blocks per operation.
+
+    Each repeat times the reference operation and then the operation, so that both are timed under the same load. The
+    repeats are kept short, so that most of them are not interrupted by other processes. The time and the cost relative
+    to the reference are the medians over the repeats. The memory is the mean, over a separate run of the operations,
+    of the peak memory traced by `tracemalloc` during each operation, i.e. the most memory held at once rather than the
+    total allocated. Since the peak misses short-lived allocations, the number of memory blocks that the operations
+    leave allocated, as counted by `sys.getallocatedblocks` with their results kept, is measured as well; it grows
+    with the objects that an operation builds and with any that it leaks.
+
+    :param operation: The operation to measure.
+    :param num_ops: The number of operations with which to warm up and over which to measure the memory and the
+        allocated blocks.
+    :param num_repeats: The number of repeats.
+    :param repeat_duration: The approximate number of seconds that the timing of each operation takes per repeat.
+    :return: The result of the measurement.
+    """
+
+    reference_num_ops_per_repeat: int = max(
+        1,
+        round(repeat_duration * 1e9 / await _time_ops(operation=reference_operation, num_ops=num_ops))
+    )
+    num_ops_per_repeat: int = max(1, round(repeat_duration * 1e9 / await _time_ops(operation=operation, num_ops=num_ops)))
+
+    ns_per_op_samples: list[float] = []
+    relative_cost_samples: list[float] = []
+    for _ in range(num_repeats):
+        reference_ns_per_op = await _time_ops(operation=reference_operation, num_ops=reference_num_ops_per_repeat)
+        ns_per_op = await _time_ops(operation=operation, num_ops=num_ops_per_repeat)
+        ns_per_op_samples.append(ns_per_op)
+        relative_cost_samples.append(ns_per_op / reference_ns_per_op)
+
+    relative_cost: float = median(relative_cost_samples)
+    first_quartile, _, third_quartile = quantiles(relative_cost_samples, n=4) if num_repeats >= 2 else (0.0, 0.0, 0.0)
+
+    total_peak_size = 0
+
+    tracemalloc_start()
+    try:
+        for _ in range(num_ops):
+            start_size, _ = get_traced_memory()
+            reset_peak()
+            if iscoroutinefunction(operation):
+                await operation()
+            else:
+                operation()
+            _, peak_size = get_traced_memory()
+            total_peak_size += peak_size - start_size
+    finally:
+        tracemalloc_stop()
+
+    # The list of results is allocated up front, so that its growth is not counted.
+    results: list[Any] = [None] * num_ops
+    gc_collect()
+    start_num_blocks: int = getallocatedblocks()
+    for i in range(num_ops):
+        results[i] = await operation() if iscoroutinefunction(operation) else operation()
+    num_blocks: int = getallocatedblocks() - start_num_blocks
+    del results
+
+    return BenchmarkResult(
+        ns_per_op=median(ns_per_op_samples),
+        relative_cost=relative_cost,
+        spread=(third_quartile - first_quartile) / relative_cost,
+        peak_bytes_per_op=total_peak_size / num_ops,
+        allocated_blocks_per_op=num_blocks / num_ops
+    )
+
+
+class BenchmarkArgumentParser(TypedArgumentParser):
+
+    class Namespace:
+        num_ops: int
+        num_repeats: int
+        repeat_duration: float
+        tolerance: float
+        update_baseline: bool
+        filter: Optional[str]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(
+            *args,
+            **(
+                dict(
+                    description=(
+                        'Run micro-benchmarks of the parser and serializer against a corpus of recorded ICAP traffic, '
+                        'and compare the results with a stored baseline.'
+                    ),
+                    formatter_class=ArgumentDefaultsHelpFormatter
+                ) | kwargs
+            )
+        )
+
+        self.add_argument(
+            '--num-ops',
+            help=(
+                'The number of operations with which to warm up and over which to measure the peak memory and the '
+                'allocated blocks.'
+            ),
+            type=int,
+            default=200
+        )
+
+        self.add_argument(
+            '--num-repeats',
+            help='The number of repeats, of which the median is reported.',
+            type=int,
+            default=51
+        )
+
+        self.add_argument(
+            '--repeat-duration',
+            help=(
+                'The approximate number of seconds that the timing of a benchmark takes per repeat. Short repeats are '
+                'less likely to be interrupted by other processes.'
+            ),
+            metavar='SECONDS',
+            type=float,
+            default=0.0005
+        )
+
+        self.add_argument(
+            '--tolerance',
+            help=(
+                'The fraction by which a result may exceed the baseline before it is considered a regression. The '
+                'spread of a benchmark\'s repeats in the run is added to this fraction for its time.'
+            ),
+            type=float,
+            default=0.25
+        )
+
+        self.add_argument(
+            '--update-baseline',
+            help=(
+                'Write the results into the baseline instead of comparing with it. The baseline entries of benchmarks '
+                'that are not run are kept.'
+            ),
+            action='store_true'
+        )
+
+        self.add_argument(
+            '--filter',
+            help='Only run the benchmarks whose names contain this string.'
+        )
+
+
+async def main() -> int:
+    args: Type[BenchmarkArgumentParser.Namespace] = BenchmarkArgumentParser().parse_args()
+
+    baseline: dict[str, dict[str, float]] = json_loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+
+    name_to_result: dict[str, BenchmarkResult] = {}
+    regressions: list[str] = []
+
+    print(
+        f'{"benchmark":<88} {"ns/op":>10} {"relative":>9} {"peak bytes/op":>14} {"blocks/op":>10} '
+        f'{"baseline relative":>18} {"baseline peak bytes/op":>23} {"baseline blocks/op":>19}'
+    )
+
+    for path in sorted(CORPUS_DIRECTORY.glob('*.icap')):
+        message = await CorpusMessage.from_path(path=path)
+
+        for name, operation in make_benchmarks(message=message).items():
+            if args.filter and args.filter not in name:
+                continue
+
+            result = await measure(
+                operation=operation,
+                num_ops=args.num_ops,
+                num_repeats=args.num_repeats,
+                repeat_duration=args.repeat_duration
+            )
+            name_to_result[name] = result
+
+            baseline_result: Optional[dict[str, float]] = baseline.get(name)
+            baseline_columns = (
+                f'{baseline_result["relative_cost"]:>18.2f} {baseline_result["peak_bytes_per_op"]:>23.0f} '
+                f'{baseline_result["allocated_blocks_per_op"]:>19.1f}'
+                if baseline_result else f'{"-":>18} {"-":>23} {"-":>19}'
+            )
+            print(
+                f'{name:<88} {result.ns_per_op:>10.0f} {result.relative_cost:>9.2f} '
+                f'{result.peak_bytes_per_op:>14.0f} {result.allocated_blocks_per_op:>10.1f} {baseline_columns}'
+            )
+
+            if baseline_result and not args.update_baseline:
+                if result.relative_cost > baseline_result['relative_cost'] * (1 + args.tolerance + result.spread):
+                    regressions.append(
+                        f'{name}: {result.relative_cost:.2f} times the reference '
+                        f'(baseline {baseline_result["relative_cost"]:.2f})'
+                    )
+                # Allow for some slack in small peak sizes, which vary with the interpreter's free lists.
+                if result.peak_bytes_per_op > baseline_result['peak_bytes_per_op'] * (1 + args.tolerance) + 64:
+                    regressions.append(
+                        f'{name}: {result.peak_bytes_per_op:.0f} peak bytes/op '
+                        f'(baseline {baseline_result["peak_bytes_per_op"]:.0f})'
+                    )
+                # Allow for a block of slack, for the interpreter's occasional internal allocations.
+                if result.allocated_blocks_per_op > baseline_result['allocated_blocks_per_op'] * (1 + args.tolerance) + 1:
+                    regressions.append(
+                        f'{name}: {result.allocated_blocks_per_op:.1f} allocated blocks/op '
+                        f'(baseline {baseline_result["allocated_blocks_per_op"]:.1f})'
+                    )
+
+    if args.update_baseline:
+        # Merge the results into the baseline, so that a filtered run does not drop the entries of the other benchmarks.
+        BASELINE_PATH.write_text(
+            json_dumps(
+                baseline | {
+                    name: dict(
+                        relative_cost=round(result.relative_cost, 3),
+                        ns_per_op=round(result.ns_per_op),
+                        peak_bytes_per_op=round(result.peak_bytes_per_op),
+                        allocated_blocks_per_op=round(result.allocated_blocks_per_op, 2)
+                    )
+                    for name, result in name_to_result.items()
+                },
+                indent=4
+            ) + '\n'
+        )
+        print(f'Wrote the baseline to "{BASELINE_PATH}".')
+        return 0
+
+    if regressions:
+        print('Regressions past the baseline:')
+        for regression in regressions:
+            print(f'  {regression}')
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys_exit(asyncio_run(main()))
@@ -1,58 +1,201 @@
 #!/usr/bin/env python
 
-from typing import Final, Type, NoReturn
-from collections import defaultdict
-from asyncio.base_events import Server
-from asyncio import run as asyncio_run
+from typing import Final, Type, Optional
+from asyncio import run as asyncio_run, get_running_loop, Event, Future, Task, wait_for, \
+    TimeoutError as AsyncioTimeoutError
 from logging import getLogger, Logger, INFO, StreamHandler, ERROR
-from sys import stderr, stdout
+from sys import stderr, stdout, executable, argv
+from socket import socket
+from asyncio.base_events import Server
+from signal import SIGHUP, SIGTERM, SIGINT, SIGUSR1, SIGUSR2
+from subprocess import Popen
+from itertools import chain
+from os import pipe, read, write, close, stat
 
 from ecs_tools_py import make_log_handler
 
-from icap_server.structures.icap_request import ICAPRequest
-from icap_server.structures.content_adaptation_response import ContentAdaptationResponse
-from icap_server.structures.icap_method import ICAPMethod
-from icap_server.exceptions import UnexpectedCase
 from icap_server.cli import ICAPServerArgumentParser
 from icap_server import run_server
+from icap_server.listeners import ServerGroup, get_inherited_sockets, remove_unix_socket_file, is_unix_socket
+from icap_server.server_context import ServerContext, reimport_handlers
+from icap_server.load_shedding import LoadShedder, is_static_asset
+from icap_server.profiling import RequestProfiler, start_control_server
+from icap_server.echo_service import service_handler
 
 
 LOG: Final[Logger] = getLogger(__name__)
 
+# The number of seconds to wait for a new server process to report that it is listening.
+SUCCESSOR_READY_TIMEOUT: Final[float] = 30.0
+
+# The options that determine the listening sockets, which a new server process receives as inherited file descriptors.
+LISTENER_OPTION_NAMES: Final[frozenset[str]] = frozenset(
+    {'--host', '--port', '--unix-socket', '--listen-fd', '--ready-fd'}
+)
+LISTENER_FLAG_NAMES: Final[frozenset[str]] = frozenset({'--systemd'})
+
+
+def reload_service_handlers(server_group: ServerGroup) -> None:
+    """
+    Re-import the service handlers and bump the ISTag.
+
+    :param server_group: The group of servers whose service handlers to reload.
+    """
+
+    server_context = server_group.server_context
+
+    try:
+        server_context.reload(service_name_to_handler=reimport_handlers(server_context.service_name_to_handler))
+    except:
+        LOG.exception('An exception occurred when reloading the service handlers.')
+        return
+
+    LOG.info(f'Reloaded the service handlers with the new ISTag \"{server_context.istag.decode()}\".')
+
+
+def toggle_profiling(profiler: RequestProfiler, duration: float) -> None:
+    """
+    Start profiling requests for a duration, or stop profiling if it is active.
+
+    :param profiler: The profiler to toggle.
+    :param duration: The number of seconds for which to profile.
+    """
+
+    if profiler.active:
+        profiler.stop()
+    else:
+        profiler.start(duration=duration)
+
+
+def strip_listener_arguments(arguments: list[str]) -> list[str]:
+    """
+    Remove the options that determine the listening sockets from command-line arguments.
+
+    The options are matched by their full names, which the argument parser requires, as it does not allow
+    abbreviations.
+
+    :param arguments: The command-line arguments, without the program name.
+    :return: The arguments without the listener options and their values.
+    """
+
+    stripped_arguments: list[str] = []
 
-async def service_handler(icap_request: ICAPRequest) -> ContentAdaptationResponse:
+    arguments_iterator = iter(arguments)
+    for argument in arguments_iterator:
+        if argument == '--':
+            stripped_arguments.append(argument)
+            stripped_arguments.extend(arguments_iterator)
+            break
+
+        name = argument.split('=', maxsplit=1)[0]
+        if name in LISTENER_FLAG_NAMES:
+            continue
+        if name in LISTENER_OPTION_NAMES:
+            if '=' not in argument:
+                next(arguments_iterator, None)
+            continue
+
+        stripped_arguments.append(argument)
+
+    return stripped_arguments
+
+
+def spawn_successor(server_group: ServerGroup, ready_fd: int) -> Popen:
     """
-    Handle an incoming ICAP request that is available for content adaptation.
+    Start a new server process that takes over the listening sockets.
+
+    The new process is started with the arguments of the current process, with the listener options replaced by the
+    file descriptors of the listening sockets. The file descriptors of Unix domain sockets whose files the current
+    process would remove on shutdown are passed with the paths of the files, so that the new process removes them
+    instead.
 
-    :param icap_request: An ICAP request available for content adaptation.
-    :return: Information about the content adaptation performed.
+    :param server_group: The group of servers whose listening sockets to hand over.
+    :param ready_fd: The file descriptor of a pipe to which the new process writes once it is listening.
+    :return: The new process.
     """
 
-    icap_response_headers: defaultdict[bytes, list[bytes]] = defaultdict(list)
-
-    if request_header := icap_request.body.request_header:
-        LOG.info(request_header.split(sep=b'\n', maxsplit=1)[0].rstrip().decode())
-
-    match method := icap_request.request_line.method:
-        case ICAPMethod.OPTIONS:
-            icap_response_code = 200
-            icap_response_headers[b'Methods'].append(b'REQMOD')
-            icap_response_headers[b'Preview'].append(b'0')
-        case ICAPMethod.REQMOD:
-            icap_response_code = 200
-        case _:
-            raise UnexpectedCase(observed_case=method, expected_cases=[ICAPMethod.OPTIONS, ICAPMethod.REQMOD])
-
-    return ContentAdaptationResponse(
-        content=icap_request.body,
-        icap_response_code=icap_response_code,
-        icap_response_headers=dict(icap_response_headers),
-        content_was_altered=False
+    fds: list[int] = []
+    listen_fd_values: list[str] = []
+    for sock in server_group.sockets:
+        fds.append(fd := sock.fileno())
+        if is_unix_socket(sock=sock) and (path := sock.getsockname()) in server_group.unix_socket_path_to_inode:
+            listen_fd_values.append(f'{fd}:{path}')
+        else:
+            listen_fd_values.append(str(fd))
+
+    return Popen(
+        [
+            executable, argv[0],
+            *strip_listener_arguments(arguments=argv[1:]),
+            *chain.from_iterable(('--listen-fd', value) for value in listen_fd_values),
+            '--ready-fd', str(ready_fd)
+        ],
+        pass_fds=[*fds, ready_fd]
     )
 
 
-async def main() -> NoReturn:
+async def wait_until_ready(ready_fd: int) -> bool:
+    """
+    Wait for a process to write to a readiness pipe.
+
+    :param ready_fd: The file descriptor of the read end of the pipe.
+    :return: Whether the process reported that it is ready; `False` if it closed the pipe without writing to it, e.g. by
+        exiting.
+    """
+
+    loop = get_running_loop()
+    readable: Future = loop.create_future()
+    loop.add_reader(ready_fd, lambda: readable.done() or readable.set_result(None))
+    try:
+        await readable
+    finally:
+        loop.remove_reader(ready_fd)
+
+    return read(ready_fd, 1) != b''
+
+
+async def hand_over(server_group: ServerGroup, stop_event: Event) -> None:
+    """
+    Hand over the listening sockets to a new server process, and stop the current one once the new one is listening.
+
+    If the new process exits or is not ready in time, it is terminated and the current process keeps serving.
+
+    :param server_group: The group of servers whose listening sockets to hand over.
+    :param stop_event: An event to set to stop the current process.
+    """
+
+    read_fd, write_fd = pipe()
+    try:
+        try:
+            successor = spawn_successor(server_group=server_group, ready_fd=write_fd)
+        finally:
+            close(write_fd)
+
+        try:
+            ready = await wait_for(wait_until_ready(ready_fd=read_fd), timeout=SUCCESSOR_READY_TIMEOUT)
+        except AsyncioTimeoutError:
+            ready = False
+    except:
+        LOG.exception('An exception occurred when handing over the listening sockets.')
+        return
+    finally:
+        close(read_fd)
+
+    if not ready:
+        LOG.error(f'Process {successor.pid} did not become ready; keeping the listening sockets.')
+        if successor.poll() is None:
+            successor.terminate()
+        await get_running_loop().run_in_executor(None, successor.wait)
+        return
+
+    LOG.info(f'Handed over the listening sockets to process {successor.pid}.')
+    server_group.detach_unix_socket_files()
+    stop_event.set()
+
+
+async def main() -> None:
     from icap_server import LOG as ICAP_SERVER_LOG
+    from icap_server.echo_service import LOG as ECHO_SERVICE_LOG
     from ecs_tools_py.system import LOG as ECS_TOOLS_PY_SYSTEM_LOG
 
     ICAP_SERVER_LOG.setLevel(level=ERROR)
@@ -62,18 +205,96 @@ async def main() -> NoReturn:
 
     LOG.setLevel(level=INFO)
     LOG.addHandler(hdlr=StreamHandler(stream=stdout))
+    # The logger is kept when the module is re-imported, since loggers are registered by name.
+    ECHO_SERVICE_LOG.setLevel(level=INFO)
+    ECHO_SERVICE_LOG.addHandler(hdlr=StreamHandler(stream=stdout))
+    ECHO_SERVICE_LOG.propagate = False
 
     args: Type[ICAPServerArgumentParser.Namespace] = ICAPServerArgumentParser().parse_args()
 
+    sockets: list[socket] = [socket(fileno=fd) for fd, _ in (args.listen_fd or [])]
+    if args.systemd:
+        sockets.extend(get_inherited_sockets())
+
+    hosts: Optional[list[str]] = args.host or (None if (args.unix_socket or sockets) else ['127.0.0.1'])
+
+    service_name_to_handler = {args.service_name.encode(): service_handler}
+
+    service_name_to_load_shedder: dict[bytes, LoadShedder] = {}
+    if args.latency_budget is not None:
+        service_name_to_load_shedder[args.service_name.encode()] = LoadShedder(
+            latency_budget=args.latency_budget,
+            max_in_flight=args.max_in_flight,
+            is_sheddable=is_static_asset if args.shed_static_assets_only else None
+        )
+
+    profiler = RequestProfiler(output_directory=args.profile_output_directory)
+
     run_server_options = dict(
-        service_name_to_handler={args.service_name.encode(): service_handler},
-        server_options=dict(host=args.host, port=args.port)
+        service_name_to_handler=service_name_to_handler,
+        server_context=ServerContext(
+            service_name_to_handler=service_name_to_handler,
+            max_decoded_body_size=args.max_decoded_body_size,
+            service_name_to_load_shedder=service_name_to_load_shedder,
+            profiler=profiler
+        ),
+        server_options=dict(host=hosts, port=args.port) if hosts else None,
+        unix_socket_paths=args.unix_socket or [],
+        unix_socket_mode=args.unix_socket_mode,
+        sockets=sockets
     )
 
-    server: Server
-    async with run_server(**run_server_options) as server:
-        LOG.info(f'Starting ICAP server on {args.host}:{args.port} with service \"{args.service_name}\".')
-        await server.serve_forever()
+    server_group: ServerGroup
+    async with run_server(**run_server_options) as server_group:
+        # The files of Unix domain sockets handed over by a predecessor are removed on shutdown, as if bound here.
+        for _, path in args.listen_fd or []:
+            if path is not None:
+                server_group.attach_unix_socket_file(path=path)
+
+        listener_names = ', '.join(str(sock.getsockname()) for sock in server_group.sockets)
+        LOG.info(f'Starting ICAP server on {listener_names} with service \"{args.service_name}\".')
+
+        stop_event = Event()
+        hand_over_tasks: set[Task] = set()
+
+        def start_hand_over() -> None:
+            if hand_over_tasks:
+                LOG.warning('A hand-over of the listening sockets is already in progress.')
+                return
+
+            task = loop.create_task(hand_over(server_group=server_group, stop_event=stop_event))
+            hand_over_tasks.add(task)
+            task.add_done_callback(hand_over_tasks.discard)
+
+        loop = get_running_loop()
+        loop.add_signal_handler(SIGHUP, reload_service_handlers, server_group)
+        loop.add_signal_handler(SIGUSR1, toggle_profiling, profiler, args.profile_duration)
+        loop.add_signal_handler(SIGUSR2, start_hand_over)
+        loop.add_signal_handler(SIGTERM, stop_event.set)
+        loop.add_signal_handler(SIGINT, stop_event.set)
+
+        control_server: Optional[Server] = None
+        control_socket_inode: Optional[int] = None
+        if args.control_socket:
+            control_server = await start_control_server(
+                path=args.control_socket,
+                profiler=profiler,
+                mode=args.control_socket_mode
+            )
+            control_socket_inode = stat(args.control_socket).st_ino
+
+        if args.ready_fd is not None:
+            write(args.ready_fd, b'1')
+            close(args.ready_fd)
+
+        await stop_event.wait()
+
+        if control_server is not None:
+            control_server.close()
+            remove_unix_socket_file(path=args.control_socket, inode=control_socket_inode)
+
+        LOG.info('Draining connections.')
+        await server_group.shutdown(timeout=args.drain_timeout)
 
 
 if __name__ == '__main__':
@@ -1,15 +1,23 @@
-from asyncio import start_server, StreamReader, StreamWriter
-from typing import Optional, Awaitable, Callable, Any, Final
+from asyncio import start_server, start_unix_server, StreamReader, StreamWriter, Task, current_task
+from typing import Optional, Any, Final, AsyncIterator, Iterable
 from functools import partial
 from contextlib import asynccontextmanager
 from logging import getLogger, Logger
+from socket import socket
 
 from icap_server.structures.icap_request import ICAPRequest
+from icap_server.structures.icap_request_line import ICAPRequestLine
 from icap_server.structures.encapsulated_data import EncapsulatedData
 from icap_server.structures.icap_response import ICAPResponse
 from icap_server.structures.icap_method import ICAPMethod
+from icap_server.structures.headers import Headers
 from icap_server.structures.content_adaptation_response import ContentAdaptationResponse
 from icap_server.exceptions import MultipleHeadersError
+from icap_server.listeners import ServerGroup, is_unix_socket, bind_unix_socket, remove_unix_socket_file
+from icap_server.server_context import ServerContext, ServiceHandler
+from icap_server.content_coding import restore_response_body_encoding
+from icap_server.profiling import RequestProfiler
+from icap_server.buffer_pool import SendBuffer
 
 LOG: Final[Logger] = getLogger(__name__)
 
@@ -19,63 +27,146 @@ def check_if_connection_close(connection_header_values: Optional[list[bytes]]) -
         if (num_headers_observed := len(connection_header_values)) != 1:
             raise MultipleHeadersError(observed_num_headers=num_headers_observed, header_name=b'Connection')
 
-        if next(iter(connection_header_values)) == 'close':
+        if next(iter(connection_header_values)).lower() == b'close':
             return True
 
     return False
 
 
+async def call_handler(icap_request: ICAPRequest, server_context: ServerContext) -> ContentAdaptationResponse:
+    """
+    Call the handler of the service that an ICAP request is for, unless the service is shedding load.
+
+    A shed request fails open: it is answered as if the handler did not alter its content.
+
+    :param icap_request: An ICAP request available for content adaptation.
+    :param server_context: State shared by the server's connections.
+    :return: Information about the content adaptation performed.
+    """
+
+    service_name: bytes = icap_request.request_line.service_name
+    handler: ServiceHandler = server_context.service_name_to_handler[service_name]
+
+    if (
+        icap_request.request_line.method is ICAPMethod.OPTIONS
+        or (load_shedder := server_context.service_name_to_load_shedder.get(service_name)) is None
+    ):
+        return await handler(icap_request)
+
+    if load_shedder.should_shed(icap_request=icap_request):
+        return ContentAdaptationResponse(
+            content=icap_request.body,
+            icap_response_code=200,
+            icap_response_headers=Headers(),
+            content_was_altered=False
+        )
+
+    call_id: int = load_shedder.handler_started()
+    try:
+        return await handler(icap_request)
+    finally:
+        load_shedder.handler_finished(call_id=call_id)
+
+
 async def handle(
     reader: StreamReader,
     writer: StreamWriter,
     *,
-    service_name_to_handler: dict[bytes, Callable[[ICAPRequest], Awaitable[ContentAdaptationResponse]]]
+    server_context: ServerContext
 ) -> None:
 
+    server_context.connection_opened(writer=writer)
+    send_buffer = SendBuffer()
+
+    # A connection is busy from the moment a request line has been read, so that draining does not close connections
+    # whose requests are still being received.
+    def on_request_line(_: ICAPRequestLine) -> None:
+        server_context.request_started(writer=writer)
+
     while True:
-        try:
-            icap_request = await ICAPRequest.from_reader(reader=reader)
-        except:
-            # TODO: Handle specific exceptions?
-            LOG.exception('An exception occurred when reading an ICAP request.')
-            break
+        profiler: Optional[RequestProfiler] = server_context.profiler
+        profiled_task: Optional[Task] = current_task() if profiler is not None and profiler.active else None
+        if profiled_task is not None:
+            profiler.request_started(task=profiled_task)
 
-        if icap_request is None:
-            break
+        icap_request: Optional[ICAPRequest] = None
 
         try:
-            content_adaptation_response: ContentAdaptationResponse = await service_name_to_handler[icap_request.request_line.service_name](icap_request)
-            icap_response_code: int = content_adaptation_response.icap_response_code
-
-            # If the data is unmodified, try to avoid having to copy it back in the response to the client.
-            if not content_adaptation_response.content_was_altered:
-                if b'204' in icap_request.headers.get(b'allow', [b'']) or icap_request.headers.get(b'preview'):
-                    icap_response_code = 204
-
-            icap_response = ICAPResponse.make(
-                method=icap_request.request_line.method,
-                encapsulated_data=content_adaptation_response.content,
-                status_code=icap_response_code,
-                headers=content_adaptation_response.icap_response_headers
-            )
-
             try:
-                writer.write(data=bytes(icap_response))
-                await writer.drain()
+                icap_request = await ICAPRequest.from_reader(
+                    reader=reader,
+                    max_decoded_body_size=server_context.max_decoded_body_size,
+                    on_request_line=on_request_line
+                )
             except:
-                LOG.exception('An exception occurred when writing an ICAP response.')
-                continue
+                # TODO: Handle specific exceptions?
+                LOG.exception('An exception occurred when reading an ICAP request.')
+                break
+
+            if icap_request is None:
+                break
 
-            LOG.info(f'"{bytes(icap_request.request_line).decode()}" {icap_response.status_line.status_code}')
+            try:
+                content_adaptation_response: ContentAdaptationResponse = await call_handler(
+                    icap_request=icap_request,
+                    server_context=server_context
+                )
+                icap_response_code: int = content_adaptation_response.icap_response_code
+
+                # If the data is unmodified, try to avoid having to copy it back in the response to the client.
+                if not content_adaptation_response.content_was_altered:
+                    if b'204' in icap_request.headers.get(b'allow', [b'']) or icap_request.headers.get(b'preview'):
+                        icap_response_code = 204
+
+                encapsulated_data: EncapsulatedData = content_adaptation_response.content
+                if icap_response_code != 204:
+                    encapsulated_data = restore_response_body_encoding(
+                        encapsulated_data=encapsulated_data,
+                        content_was_altered=content_adaptation_response.content_was_altered
+                    )
+
+                icap_response_headers = content_adaptation_response.icap_response_headers
+                if not isinstance(icap_response_headers, Headers):
+                    icap_response_headers = Headers(icap_response_headers)
+                if server_context.draining:
+                    icap_response_headers[b'Connection'] = [b'close']
+
+                icap_response = ICAPResponse.make(
+                    method=icap_request.request_line.method,
+                    encapsulated_data=encapsulated_data,
+                    status_code=icap_response_code,
+                    headers=icap_response_headers,
+                    istag=server_context.istag
+                )
+
+                try:
+                    send_buffer.write(writer=writer, parts=icap_response.parts())
+                    await writer.drain()
+                except:
+                    LOG.exception('An exception occurred when writing an ICAP response.')
+                    continue
+
+                LOG.info(f'"{bytes(icap_request.request_line).decode()}" {icap_response.status_line.status_code}')
+
+                if check_if_connection_close(connection_header_values=icap_request.headers.get(b'connection')):
+                    break
+            except:
+                LOG.exception('Unexpected exception.')
+                break
 
-            if check_if_connection_close(connection_header_values=icap_request.headers.get(b'connection')):
+            if server_context.draining:
                 break
-        except:
-            LOG.exception('Unexpected exception.')
-            break
+        finally:
+            server_context.request_finished(writer=writer)
+            if profiled_task is not None:
+                profiler.request_finished(
+                    task=profiled_task,
+                    service_name=icap_request.request_line.service_name if icap_request is not None else None
+                )
 
     # TODO: Write error response in case of problem,
 
+    server_context.connection_closed(writer=writer)
     writer.close()
 
     try:
@@ -87,20 +178,54 @@ async def handle(
 @asynccontextmanager
 async def run_server(
     *,
-    service_name_to_handler: dict[bytes, Callable[[ICAPRequest], Awaitable[ContentAdaptationResponse]]],
-    server_options: Optional[dict[str, Any]] = None
-) -> None:
+    service_name_to_handler: dict[bytes, ServiceHandler],
+    server_options: Optional[dict[str, Any]] = None,
+    unix_socket_paths: Iterable[str] = (),
+    unix_socket_mode: Optional[int] = None,
+    sockets: Iterable[socket] = (),
+    server_context: Optional[ServerContext] = None
+) -> AsyncIterator[ServerGroup]:
     """
+    Run an ICAP server on one or more listeners.
 
     :param service_name_to_handler: A map of handlers for ICAP service names.
-    :param server_options: Options passed to `asyncio.start_server`.
-    :return:
+    :param server_options: Options passed to `asyncio.start_server`, for listening on TCP.
+    :param unix_socket_paths: Paths of Unix domain sockets on which to listen.
+    :param unix_socket_mode: Permission bits to set on the Unix domain socket files, e.g. `0o660`.
+    :param sockets: Already listening sockets, e.g. inherited via systemd socket activation, on which to listen.
+    :param server_context: State shared by the server's connections. Created from `service_name_to_handler` if not
+        provided.
+    :return: A group of the servers listening on each listener.
     """
 
-    start_server_options = dict(
-        client_connected_cb=partial(handle, service_name_to_handler=service_name_to_handler),
-        **server_options
-    )
+    server_context = server_context or ServerContext(service_name_to_handler=service_name_to_handler)
+    client_connected_cb = partial(handle, server_context=server_context)
+
+    server_group = ServerGroup(server_context=server_context)
+
+    try:
+        if server_options is not None:
+            server_group.servers.append(
+                await start_server(client_connected_cb=client_connected_cb, **server_options)
+            )
+
+        for unix_socket_path in unix_socket_paths:
+            server_group.servers.append(
+                await start_unix_server(
+                    client_connected_cb=client_connected_cb,
+                    sock=bind_unix_socket(path=unix_socket_path, mode=unix_socket_mode)
+                )
+            )
+            server_group.attach_unix_socket_file(path=unix_socket_path)
+
+        for sock in sockets:
+            start_function = start_unix_server if is_unix_socket(sock=sock) else start_server
+            server_group.servers.append(await start_function(client_connected_cb=client_connected_cb, sock=sock))
+
+        yield server_group
+    finally:
+        server_group.close()
+        await server_group.wait_closed()
 
-    async with await start_server(**start_server_options) as server:
-        yield server
+        for unix_socket_path, inode in server_group.unix_socket_path_to_inode.items():
+            remove_unix_socket_file(path=unix_socket_path, inode=inode)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+from asyncio import StreamWriter
+from typing import Final, Optional, Iterable, Union
+
+DEFAULT_SIZE_CLASSES: Final[tuple[int, ...]] = (4 * 1024, 64 * 1024, 256 * 1024)
+DEFAULT_MAX_BUFFERS_PER_CLASS: Final[int] = 8
+DEFAULT_SEND_BUFFER_SIZE: Final[int] = 4 * 1024
+
+
+class BufferPool:
+    """
+    A bounded pool of reusable buffers, grouped by size class.
+
+    Buffers are handed out at the length of their size class and are never resized, so that their memory can be reused
+    as is. Requests for buffers larger than the largest size class are served with unpooled buffers.
+
+    Free buffers are retained for the lifetime of the pool: at most `max_buffers_per_class` times the sum of the size
+    classes, i.e. 2.5 MiB with the defaults.
+    """
+
+    __slots__ = ('size_classes', 'max_buffers_per_class', '_size_to_buffers')
+
+    def __init__(
+        self,
+        size_classes: Iterable[int] = DEFAULT_SIZE_CLASSES,
+        max_buffers_per_class: int = DEFAULT_MAX_BUFFERS_PER_CLASS
+    ):
+        """
+        :param size_classes: The sizes of the pooled buffers.
+        :param max_buffers_per_class: The maximum number of free buffers kept per size class.
+        """
+
+        self.size_classes: tuple[int, ...] = tuple(sorted(size_classes))
+        self.max_buffers_per_class: int = max_buffers_per_class
+        self._size_to_buffers: dict[int, list[bytearray]] = {size: [] for size in self.size_classes}
+
+    def _size_class(self, min_size: int) -> Optional[int]:
+        for size in self.size_classes:
+            if size >= min_size:
+                return size
+
+        return None
+
+    def acquire(self, min_size: int) -> bytearray:
+        """
+        Obtain a buffer of at least a given size.
+
+        :param min_size: The minimum size of the buffer.
+        :return: A buffer whose length is its capacity.
+        """
+
+        if (size := self._size_class(min_size=min_size)) is None:
+            return bytearray(min_size)
+
+        if buffers := self._size_to_buffers[size]:
+            return buffers.pop()
+
+        return bytearray(size)
+
+    def release(self, buffer: bytearray) -> None:
+        """
+        Return a buffer to the pool.
+
+        The buffer must not be used after it has been released.
+
+        :param buffer: A buffer obtained with `acquire`.
+        """
+
+        if (buffers := self._size_to_buffers.get(len(buffer))) is not None and len(buffers) < self.max_buffers_per_class:
+            buffers.append(buffer)
+
+
+class BufferAccumulator:
+    """
+    Accumulates pieces of data into buffers from a pool.
+
+    A single piece is kept as is, without being copied. Several pieces are gathered into a pooled buffer, which replaces
+    the repeated resizing of a growing buffer, and are copied out of it once, by `take`, into the `bytes` object that is
+    handed to the service handlers.
+    """
+
+    __slots__ = ('buffer_pool', 'length', '_first_piece', '_buffer')
+
+    def __init__(self, buffer_pool: BufferPool):
+        self.buffer_pool: BufferPool = buffer_pool
+        self.length: int = 0
+        self._first_piece: Optional[bytes] = None
+        self._buffer: Optional[bytearray] = None
+
+    def append(self, data: bytes) -> None:
+        if not data:
+            return
+
+        end = self.length + len(data)
+
+        if self._buffer is None and self._first_piece is None:
+            self._first_piece = data
+            self.length = end
+            return
+
+        if self._buffer is None or end > len(self._buffer):
+            buffer = self.buffer_pool.acquire(min_size=max(end, 2 * self.length))
+            if self._buffer is not None:
+                buffer[:self.length] = memoryview(self._buffer)[:self.length]
+                self.buffer_pool.release(buffer=self._buffer)
+            else:
+                buffer[:self.length] = self._first_piece
+                self._first_piece = None
+            self._buffer = buffer
+
+        self._buffer[self.length:end] = data
+        self.length = end
+
+    def take(self) -> bytes:
+        """
+        Retrieve the accumulated data and return the buffer to the pool.
+
+        :return: The accumulated data.
+        """
+
+        if self._buffer is None:
+            data = self._first_piece or b''
+        else:
+            with memoryview(self._buffer) as view:
+                data = view[:self.length].tobytes()
+            self.buffer_pool.release(buffer=self._buffer)
+
+        self.length = 0
+        self._first_piece = None
+        self._buffer = None
+
+        return data
+
+
+class SendBuffer:
+    """
+    A per-connection buffer into which the small pieces of a response are gathered before being written.
+
+    The status line, the ICAP header and the encapsulated header are copied into one preallocated buffer and written
+    together with the body, which is written as is. As transports may keep references to written data until it has
+    been sent (Python >= 3.12), the buffer is only reused once the transport has no data pending; otherwise a new one is
+    allocated.
+    """
+
+    __slots__ = ('size', '_buffer')
+
+    def __init__(self, size: int = DEFAULT_SEND_BUFFER_SIZE):
+        """
+        :param size: The size of the buffer. Pieces that do not fit in the remaining space are written as is.
+        """
+
+        self.size: int = size
+        self._buffer: bytearray = bytearray(size)
+
+    def write(self, writer: StreamWriter, parts: Iterable[bytes]) -> None:
+        """
+        Write the pieces of a message, gathering those that fit into the buffer.
+
+        :param writer: The writer of the connection.
+        :param parts: The pieces of the message.
+        """
+
+        if writer.transport.get_write_buffer_size():
+            self._buffer = bytearray(self.size)
+
+        buffer: bytearray = self._buffer
+        view = memoryview(buffer)
+        pieces: list[Union[bytes, memoryview]] = []
+        start = end = 0
+
+        for part in parts:
+            part_end = end + len(part)
+            if part_end <= self.size:
+                buffer[end:part_end] = part
+                end = part_end
+            else:
+                if end > start:
+                    pieces.append(view[start:end])
+                    start = end
+                pieces.append(part)
+
+        if end > start:
+            pieces.append(view[start:end])
+
+        writer.writelines(pieces)
+
+
+BODY_BUFFER_POOL: Final[BufferPool] = BufferPool()
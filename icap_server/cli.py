@@ -1,13 +1,45 @@
 from typed_argument_parser import TypedArgumentParser
-from argparse import ArgumentDefaultsHelpFormatter
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentTypeError
+from typing import Optional
+
+
+def parse_listen_fd(value: str) -> tuple[int, Optional[str]]:
+    """
+    Parse the value of a `--listen-fd` option: a file descriptor, optionally followed by the path of the Unix domain
+    socket file that the server should remove when it shuts down.
+
+    :param value: A value of the form `FD` or `FD:PATH`.
+    :return: The file descriptor and the socket file path, or `None` if no path is provided.
+    """
+
+    fd, _, path = value.partition(':')
+
+    try:
+        return int(fd), path or None
+    except ValueError:
+        raise ArgumentTypeError(f'invalid file descriptor: {fd!r}')
 
 
 class ICAPServerArgumentParser(TypedArgumentParser):
 
     class Namespace:
         service_name: str
-        host: str
+        host: Optional[list[str]]
         port: int
+        unix_socket: Optional[list[str]]
+        unix_socket_mode: Optional[int]
+        listen_fd: Optional[list[tuple[int, Optional[str]]]]
+        systemd: bool
+        ready_fd: Optional[int]
+        drain_timeout: float
+        max_decoded_body_size: Optional[int]
+        latency_budget: Optional[float]
+        max_in_flight: Optional[int]
+        shed_static_assets_only: bool
+        profile_output_directory: str
+        profile_duration: float
+        control_socket: Optional[str]
+        control_socket_mode: int
 
     def __init__(self, *args, **kwargs):
         super().__init__(
@@ -18,7 +50,9 @@ class ICAPServerArgumentParser(TypedArgumentParser):
                         'Run an ICAP server with a REQMOD service that echos handled request lines, '
                         'performing no content adaptation.'
                     ),
-                    formatter_class=ArgumentDefaultsHelpFormatter
+                    formatter_class=ArgumentDefaultsHelpFormatter,
+                    # Abbreviated options would escape the matching of listener options on a hand-over.
+                    allow_abbrev=False
                 ) | kwargs
             )
         )
@@ -30,8 +64,11 @@ class ICAPServerArgumentParser(TypedArgumentParser):
 
         self.add_argument(
             '--host',
-            help='The host address on which to listen.',
-            default='127.0.0.1'
+            help=(
+                'A host address on which to listen. Can be specified multiple times. Defaults to 127.0.0.1 if no other '
+                'listener is specified.'
+            ),
+            action='append'
         )
 
         self.add_argument(
@@ -39,3 +76,124 @@ class ICAPServerArgumentParser(TypedArgumentParser):
             help='The port on which to listen.',
             default=1344
         )
+
+        self.add_argument(
+            '--unix-socket',
+            help='The path of a Unix domain socket on which to listen. Can be specified multiple times.',
+            metavar='PATH',
+            action='append'
+        )
+
+        self.add_argument(
+            '--unix-socket-mode',
+            help='The permission bits, in octal, to set on the Unix domain socket files.',
+            metavar='MODE',
+            type=lambda value: int(value, 8)
+        )
+
+        self.add_argument(
+            '--listen-fd',
+            help=(
+                'The file descriptor of an already listening socket on which to listen, optionally followed by the path '
+                'of its Unix domain socket file, which is then removed on shutdown. Can be specified multiple times.'
+            ),
+            metavar='FD[:PATH]',
+            type=parse_listen_fd,
+            action='append'
+        )
+
+        self.add_argument(
+            '--systemd',
+            help='Listen on the sockets passed by systemd socket activation (`LISTEN_FDS`).',
+            action='store_true'
+        )
+
+        self.add_argument(
+            '--ready-fd',
+            help=(
+                'The file descriptor of a pipe to which to write once the server is listening. Used by a process that '
+                'takes over the listening sockets, on SIGUSR2, to tell its predecessor that it is ready.'
+            ),
+            metavar='FD',
+            type=int
+        )
+
+        self.add_argument(
+            '--drain-timeout',
+            help=(
+                'The number of seconds to wait for in-flight requests to finish when shutting down, on SIGTERM, or when '
+                'handing over the listening sockets to a new process, on SIGUSR2.'
+            ),
+            metavar='SECONDS',
+            type=float,
+            default=30.0
+        )
+
+        self.add_argument(
+            '--max-decoded-body-size',
+            help=(
+                'If provided, content-encoded response bodies (gzip, deflate, and br with Brotli 1.2.0 or later) are '
+                'decoded before being passed to the handler, unless their decoded size would exceed this number of '
+                'bytes.'
+            ),
+            metavar='BYTES',
+            type=int
+        )
+
+        self.add_argument(
+            '--latency-budget',
+            help=(
+                'The number of seconds a handler call may take. When the service is over budget, a fraction of requests '
+                'is answered without calling the handler, performing no content adaptation.'
+            ),
+            metavar='SECONDS',
+            type=float
+        )
+
+        self.add_argument(
+            '--max-in-flight',
+            help=(
+                'The number of handler calls that may be in flight at once before the service is considered over its '
+                'latency budget. Only applies with --latency-budget. Unlimited if not provided.'
+            ),
+            metavar='N',
+            type=int
+        )
+
+        self.add_argument(
+            '--shed-static-assets-only',
+            help='Only answer requests for static assets without calling the handler when over the latency budget.',
+            action='store_true'
+        )
+
+        self.add_argument(
+            '--profile-output-directory',
+            help='The directory in which to write profiling results.',
+            metavar='PATH',
+            default='.'
+        )
+
+        self.add_argument(
+            '--profile-duration',
+            help='The number of seconds for which to profile requests when profiling is turned on with SIGUSR1.',
+            metavar='SECONDS',
+            type=float,
+            default=10.0
+        )
+
+        self.add_argument(
+            '--control-socket',
+            help=(
+                'The path of a Unix domain socket on which to accept control commands, e.g. '
+                '"profile duration=10 requests=1000 service=echo" or "stop".'
+            ),
+            metavar='PATH'
+        )
+
+        self.add_argument(
+            '--control-socket-mode',
+            help='The permission bits, in octal, to set on the control socket file.',
+            metavar='MODE',
+            type=lambda value: int(value, 8),
+            default='600'
+        )
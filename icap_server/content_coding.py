@@ -0,0 +1,243 @@
+from __future__ import annotations
+from dataclasses import replace
+from typing import Optional, Final, Any
+from zlib import decompressobj, compress as zlib_compress, error as ZlibError, MAX_WBITS
+from gzip import compress as gzip_compress
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from icap_server.structures.encapsulated_data import EncapsulatedData
+from icap_server.exceptions import DecodedBodyTooLargeError, ContentDecodingError
+
+GZIP_CONTENT_ENCODINGS: Final[frozenset[bytes]] = frozenset({b'gzip', b'x-gzip'})
+DEFLATE_CONTENT_ENCODING: Final[bytes] = b'deflate'
+BROTLI_CONTENT_ENCODING: Final[bytes] = b'br'
+
+# Brotli bodies are only decoded if the output of the decompressor can be limited (Brotli >= 1.2.0), so that a small
+# body cannot be decoded into an arbitrarily large one before its size is checked.
+BROTLI_DECODING_SUPPORTED: Final[bool] = brotli is not None and hasattr(brotli.Decompressor, 'can_accept_more_data')
+
+
+def get_content_encoding(http_header: bytes) -> Optional[bytes]:
+    """
+    Retrieve the value of the `Content-Encoding` header from an HTTP message header.
+
+    :param http_header: An HTTP message header, starting with the request or status line.
+    :return: The lowercased content encoding, or `None` if the header is missing.
+    """
+
+    for header_line in http_header.split(sep=b'\n')[1:]:
+        name, separator, value = header_line.partition(b':')
+        if separator and name.strip().lower() == b'content-encoding':
+            return value.strip().lower() or None
+
+    return None
+
+
+def replace_content_length(http_header: bytes, content_length: int) -> bytes:
+    """
+    Replace the value of the `Content-Length` header in an HTTP message header.
+
+    A header without `Content-Length`, e.g. one of a message with a chunked transfer coding, is returned as is.
+
+    :param http_header: An HTTP message header, starting with the request or status line.
+    :param content_length: The new length of the message body.
+    :return: The HTTP message header with the new `Content-Length` value.
+    """
+
+    header_lines: list[bytes] = http_header.split(sep=b'\n')
+
+    for i, header_line in enumerate(header_lines[1:], start=1):
+        name, separator, value = header_line.partition(b':')
+        if separator and name.strip().lower() == b'content-length':
+            line_ending = b'\r' if header_line.endswith(b'\r') else b''
+            header_lines[i] = name + b': ' + str(content_length).encode() + line_ending
+
+    return b'\n'.join(header_lines)
+
+
+def is_supported_content_encoding(content_encoding: bytes) -> bool:
+    return (
+        content_encoding in GZIP_CONTENT_ENCODINGS
+        or content_encoding == DEFLATE_CONTENT_ENCODING
+        or (content_encoding == BROTLI_CONTENT_ENCODING and BROTLI_DECODING_SUPPORTED)
+    )
+
+
+class ContentDecoder:
+    """
+    An incremental decoder of a content-encoded body, whose output size is capped.
+    """
+
+    __slots__ = ('content_encoding', 'max_output_size', 'output_size', '_decompressor')
+
+    def __init__(self, content_encoding: bytes, max_output_size: int):
+        self.content_encoding: bytes = content_encoding
+        self.max_output_size: int = max_output_size
+        self.output_size: int = 0
+
+        if content_encoding in GZIP_CONTENT_ENCODINGS:
+            self._decompressor: Any = decompressobj(wbits=16 + MAX_WBITS)
+        elif content_encoding == DEFLATE_CONTENT_ENCODING:
+            # Whether the data is zlib-wrapped or raw deflate is determined from the first bytes.
+            self._decompressor = None
+        elif content_encoding == BROTLI_CONTENT_ENCODING and BROTLI_DECODING_SUPPORTED:
+            self._decompressor = brotli.Decompressor()
+        else:
+            raise ValueError(f'Unsupported content encoding: {content_encoding!r}')
+
+    def _account(self, data: bytes) -> bytes:
+        self.output_size += len(data)
+        if self.output_size > self.max_output_size:
+            raise DecodedBodyTooLargeError(max_size=self.max_output_size)
+
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        """
+        Decode a piece of the body.
+
+        :param data: The next piece of the encoded body.
+        :return: The decoded data that is available so far.
+        """
+
+        if not data:
+            return b''
+
+        if self.content_encoding == BROTLI_CONTENT_ENCODING:
+            return self._account(self._decompress_brotli(data=data))
+
+        if self._decompressor is None:
+            is_zlib_wrapped = len(data) >= 2 and (data[0] & 0x0f) == 8 and ((data[0] << 8) | data[1]) % 31 == 0
+            self._decompressor = decompressobj(wbits=MAX_WBITS if is_zlib_wrapped else -MAX_WBITS)
+
+        decoded = bytearray()
+
+        try:
+            while data:
+                remaining_size = self.max_output_size - self.output_size - len(decoded)
+                decoded += self._decompressor.decompress(data, remaining_size + 1)
+                if len(decoded) + self.output_size > self.max_output_size:
+                    raise DecodedBodyTooLargeError(max_size=self.max_output_size)
+
+                # A gzip body may consist of several members.
+                if self._decompressor.eof and self.content_encoding in GZIP_CONTENT_ENCODINGS:
+                    data = self._decompressor.unused_data
+                    if data:
+                        self._decompressor = decompressobj(wbits=16 + MAX_WBITS)
+                else:
+                    data = self._decompressor.unconsumed_tail
+        except ZlibError as e:
+            raise ContentDecodingError(content_encoding=self.content_encoding) from e
+
+        return self._account(bytes(decoded))
+
+    def _decompress_brotli(self, data: bytes) -> bytes:
+        decoded = bytearray()
+
+        try:
+            while True:
+                remaining_size = self.max_output_size - self.output_size - len(decoded)
+                decoded += self._decompressor.process(data, output_buffer_limit=remaining_size + 1)
+                if len(decoded) + self.output_size > self.max_output_size:
+                    raise DecodedBodyTooLargeError(max_size=self.max_output_size)
+
+                # Output held back by the limit must be retrieved with empty input before more input is accepted.
+                if self._decompressor.can_accept_more_data():
+                    break
+                data = b''
+        except brotli.error as e:
+            raise ContentDecodingError(content_encoding=self.content_encoding) from e
+
+        return bytes(decoded)
+
+    def flush(self) -> bytes:
+        """
+        Finish decoding the body.
+
+        :return: Any remaining decoded data.
+        """
+
+        if self._decompressor is None:
+            return b''
+
+        if self.content_encoding == BROTLI_CONTENT_ENCODING:
+            if not self._decompressor.is_finished():
+                raise ContentDecodingError(content_encoding=self.content_encoding)
+            return b''
+
+        try:
+            return self._account(self._decompressor.flush())
+        except ZlibError as e:
+            raise ContentDecodingError(content_encoding=self.content_encoding) from e
+
+
+def compress(data: bytes, content_encoding: bytes) -> bytes:
+    """
+    Encode a body with a content encoding.
+
+    :param data: The body to encode.
+    :param content_encoding: The content encoding with which to encode the body.
+    :return: The encoded body.
+    """
+
+    if content_encoding in GZIP_CONTENT_ENCODINGS:
+        return gzip_compress(data)
+    elif content_encoding == DEFLATE_CONTENT_ENCODING:
+        return zlib_compress(data)
+    elif content_encoding == BROTLI_CONTENT_ENCODING and brotli is not None:
+        return brotli.compress(data)
+    else:
+        raise ValueError(f'Unsupported content encoding: {content_encoding!r}')
+
+
+def restore_response_body_encoding(encapsulated_data: EncapsulatedData, content_was_altered: bool) -> EncapsulatedData:
+    """
+    Restore the content encoding of a response body that was decoded when it was read.
+
+    The encoding is that of the `Content-Encoding` of the outgoing response header, which the handler may have removed
+    or replaced. An unaltered body whose header still has the original encoding is replaced with the body as it was
+    received. Otherwise, the body is encoded with the encoding of the header, if it has a supported one, and is left
+    decoded if it does not; the `Content-Length` of the header is then set to the length of the resulting body.
+
+    :param encapsulated_data: Encapsulated data whose response body may have been decoded.
+    :param content_was_altered: Whether the content of the encapsulated data was altered.
+    :return: Encapsulated data with a response body in the content encoding of its response header.
+    """
+
+    if encapsulated_data.response_body_content_encoding is None:
+        return encapsulated_data
+
+    response_header: Optional[bytes] = encapsulated_data.response_header
+    response_body: Optional[bytes] = encapsulated_data.response_body
+    content_encoding: Optional[bytes] = (
+        get_content_encoding(http_header=response_header) if response_header is not None else None
+    )
+
+    if (
+        not content_was_altered
+        and encapsulated_data.encoded_response_body is not None
+        and content_encoding == encapsulated_data.response_body_content_encoding
+    ):
+        response_body = encapsulated_data.encoded_response_body
+    else:
+        if response_body is not None and content_encoding is not None and is_supported_content_encoding(
+            content_encoding=content_encoding
+        ):
+            response_body = compress(data=response_body, content_encoding=content_encoding)
+        if response_header is not None:
+            response_header = replace_content_length(
+                http_header=response_header,
+                content_length=len(response_body) if response_body is not None else 0
+            )
+
+    return replace(
+        encapsulated_data,
+        response_header=response_header,
+        response_body=response_body,
+        response_body_content_encoding=None,
+        encoded_response_body=None
+    )
@@ -0,0 +1,44 @@
+from logging import getLogger, Logger
+from typing import Final
+
+from icap_server.structures.icap_request import ICAPRequest
+from icap_server.structures.content_adaptation_response import ContentAdaptationResponse
+from icap_server.structures.icap_method import ICAPMethod
+from icap_server.structures.headers import Headers
+from icap_server.exceptions import UnexpectedCase
+
+LOG: Final[Logger] = getLogger(__name__)
+
+
+async def service_handler(icap_request: ICAPRequest) -> ContentAdaptationResponse:
+    """
+    Handle an incoming ICAP request that is available for content adaptation.
+
+    The request is logged and its content is returned unaltered. The handler is defined in its own module, so that the
+    CLI can re-import it on `SIGHUP`.
+
+    :param icap_request: An ICAP request available for content adaptation.
+    :return: Information about the content adaptation performed.
+    """
+
+    icap_response_headers = Headers()
+
+    if request_header := icap_request.body.request_header:
+        LOG.info(request_header.split(sep=b'\n', maxsplit=1)[0].rstrip().decode())
+
+    match method := icap_request.request_line.method:
+        case ICAPMethod.OPTIONS:
+            icap_response_code = 200
+            icap_response_headers.add(name=b'Methods', value=b'REQMOD')
+            icap_response_headers.add(name=b'Preview', value=b'0')
+        case ICAPMethod.REQMOD:
+            icap_response_code = 200
+        case _:
+            raise UnexpectedCase(observed_case=method, expected_cases=[ICAPMethod.OPTIONS, ICAPMethod.REQMOD])
+
+    return ContentAdaptationResponse(
+        content=icap_request.body,
+        icap_response_code=icap_response_code,
+        icap_response_headers=icap_response_headers,
+        content_was_altered=False
+    )
@@ -109,3 +109,17 @@ class HeaderValueButMissingHeaderEntityNameError(Exception):
             'An ICAP response body is requested for creation with a header value but no header entity name has '
             'been provided'
         )
+
+
+class DecodedBodyTooLargeError(Exception):
+    def __init__(self, max_size: int):
+        super().__init__(f'The decoded body exceeds the maximum size of {max_size} bytes.')
+
+        self.max_size: int = max_size
+
+
+class ContentDecodingError(Exception):
+    def __init__(self, content_encoding: bytes):
+        super().__init__(f'The body could not be decoded with the content encoding "{content_encoding.decode()}".')
+
+        self.content_encoding: bytes = content_encoding
@@ -0,0 +1,158 @@
+from __future__ import annotations
+from asyncio import gather
+from asyncio.base_events import Server
+from os import environ, getpid, stat, unlink, chmod
+from socket import socket, AF_UNIX, SOCK_STREAM
+from stat import S_ISSOCK
+from typing import Final, Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Only imported for annotations; `server_context` indirectly imports this module.
+    from icap_server.server_context import ServerContext
+
+SD_LISTEN_FDS_START: Final[int] = 3
+
+
+def get_inherited_sockets(unset_environment: bool = True) -> list[socket]:
+    """
+    Retrieve listening sockets passed to the process using the systemd socket activation protocol.
+
+    The sockets are passed as file descriptors starting at 3, their number given by the `LISTEN_FDS` environment
+    variable. The sockets are only considered to be intended for this process if `LISTEN_PID` matches its PID.
+
+    :param unset_environment: Whether to remove the socket activation variables from the environment, so that they are
+        not inherited by child processes.
+    :return: The inherited sockets, in the order in which they were passed.
+    """
+
+    try:
+        if int(environ.get('LISTEN_PID', '')) != getpid():
+            return []
+        num_fds = int(environ.get('LISTEN_FDS', ''))
+    except ValueError:
+        return []
+    finally:
+        if unset_environment:
+            for variable_name in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+                environ.pop(variable_name, None)
+
+    return [socket(fileno=fd) for fd in range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + num_fds)]
+
+
+def is_unix_socket(sock: socket) -> bool:
+    return sock.family == AF_UNIX
+
+
+def bind_unix_socket(path: str, mode: Optional[int] = None) -> socket:
+    """
+    Create a Unix domain socket bound to a path, with its permissions set before it starts listening.
+
+    A stale socket file at the path is removed first. A bound socket refuses connections until it listens, so the
+    socket is never reachable with permissions other than `mode`.
+
+    :param path: The path of the socket file.
+    :param mode: The permission bits to set on the socket file, e.g. `0o660`.
+    :return: A bound, not yet listening, socket.
+    """
+
+    try:
+        if S_ISSOCK(stat(path).st_mode):
+            unlink(path)
+    except FileNotFoundError:
+        pass
+
+    sock = socket(AF_UNIX, SOCK_STREAM)
+
+    try:
+        sock.bind(path)
+        if mode is not None:
+            chmod(path, mode)
+    except:
+        sock.close()
+        raise
+
+    return sock
+
+
+def remove_unix_socket_file(path: str, inode: int) -> None:
+    """
+    Remove a Unix domain socket file, unless it has been replaced by another file since it was bound.
+
+    :param path: The path of the socket file.
+    :param inode: The inode number of the socket file when it was bound.
+    """
+
+    try:
+        path_stat = stat(path)
+    except FileNotFoundError:
+        return
+
+    if S_ISSOCK(path_stat.st_mode) and path_stat.st_ino == inode:
+        unlink(path)
+
+
+class ServerGroup:
+    """
+    A group of servers, each with one or more listening sockets, that are operated on as one.
+    """
+
+    __slots__ = ('servers', 'server_context', 'unix_socket_path_to_inode')
+
+    def __init__(self, servers: Optional[Iterable[Server]] = None, server_context: Optional[ServerContext] = None):
+        self.servers: list[Server] = list(servers or [])
+        self.server_context: Optional[ServerContext] = server_context
+        self.unix_socket_path_to_inode: dict[str, int] = {}
+
+    @property
+    def sockets(self) -> tuple[socket, ...]:
+        return tuple(sock for server in self.servers for sock in server.sockets)
+
+    def is_serving(self) -> bool:
+        return any(server.is_serving() for server in self.servers)
+
+    async def start_serving(self) -> None:
+        await gather(*(server.start_serving() for server in self.servers))
+
+    async def serve_forever(self) -> None:
+        await gather(*(server.serve_forever() for server in self.servers))
+
+    def close(self) -> None:
+        for server in self.servers:
+            server.close()
+
+    async def wait_closed(self) -> None:
+        await gather(*(server.wait_closed() for server in self.servers))
+
+    def attach_unix_socket_file(self, path: str) -> None:
+        """
+        Remove a Unix domain socket file when the servers are closed, unless it has been replaced by then.
+
+        :param path: The path of the socket file of one of the servers' sockets.
+        """
+
+        try:
+            self.unix_socket_path_to_inode[path] = stat(path).st_ino
+        except FileNotFoundError:
+            pass
+
+    def detach_unix_socket_files(self) -> None:
+        """
+        Keep the Unix domain socket files when the servers are closed, e.g. because the sockets have been handed over to
+        another process.
+        """
+
+        self.unix_socket_path_to_inode.clear()
+
+    async def shutdown(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop accepting new connections and drain the existing ones.
+
+        :param timeout: The maximum number of seconds to wait for in-flight requests to finish.
+        """
+
+        self.close()
+
+        if self.server_context is not None:
+            await self.server_context.drain(timeout=timeout)
+
+        await self.wait_closed()
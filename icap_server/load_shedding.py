@@ -0,0 +1,177 @@
+from __future__ import annotations
+from logging import getLogger, Logger
+from random import random
+from time import monotonic
+from typing import Final, Optional, Callable
+from posixpath import splitext
+from urllib.parse import urlsplit
+
+from icap_server.structures.icap_request import ICAPRequest
+
+LOG: Final[Logger] = getLogger(__name__)
+
+STATIC_ASSET_EXTENSIONS: Final[frozenset[bytes]] = frozenset({
+    b'.css', b'.js', b'.mjs', b'.map', b'.png', b'.jpg', b'.jpeg', b'.gif', b'.webp', b'.avif', b'.svg', b'.ico',
+    b'.bmp', b'.woff', b'.woff2', b'.ttf', b'.otf', b'.eot', b'.mp3', b'.mp4', b'.webm', b'.ogg'
+})
+
+
+def is_static_asset(icap_request: ICAPRequest) -> bool:
+    """
+    Determine whether an ICAP request concerns a static asset, based on the file extension of the encapsulated HTTP
+    request's URL.
+
+    :param icap_request: An ICAP request.
+    :return: Whether the encapsulated HTTP request is for a static asset.
+    """
+
+    if not (request_header := icap_request.body.request_header):
+        return False
+
+    request_line_parts: list[bytes] = request_header.split(sep=b'\n', maxsplit=1)[0].split(sep=b' ')
+    if len(request_line_parts) < 2:
+        return False
+
+    return splitext(urlsplit(request_line_parts[1]).path)[1].lower() in STATIC_ASSET_EXTENSIONS
+
+
+class LoadShedder:
+    """
+    An adaptive controller that fails open for a service whose handler is over its latency budget.
+
+    Overload is detected CoDel-style: a service is over budget if, during an interval, even the fastest handler call
+    took longer than the latency budget, if no handler call finished while the oldest call in flight has been running
+    for longer than the latency budget, or if too many handler calls were in flight. The controller responds AIMD-style
+    by multiplicatively decreasing the fraction of sheddable requests that are admitted to the handler while over
+    budget, and additively increasing it again once the service is within budget.
+    """
+
+    __slots__ = (
+        'latency_budget', 'max_in_flight', 'interval', 'increase_step', 'decrease_factor', 'min_admission_probability',
+        'is_sheddable', 'admission_probability', '_interval_start', '_interval_min_latency', '_next_call_id',
+        '_call_id_to_start_time'
+    )
+
+    def __init__(
+        self,
+        latency_budget: float,
+        max_in_flight: Optional[int] = None,
+        interval: float = 0.1,
+        increase_step: float = 0.05,
+        decrease_factor: float = 0.5,
+        min_admission_probability: float = 0.05,
+        is_sheddable: Optional[Callable[[ICAPRequest], bool]] = None
+    ):
+        """
+        :param latency_budget: The number of seconds a handler call may take.
+        :param max_in_flight: The number of handler calls that may be in flight at once. Unlimited if not provided.
+        :param interval: The number of seconds over which latency is observed before the admission is adjusted.
+        :param increase_step: The amount by which the admission probability is increased per interval within budget.
+        :param decrease_factor: The factor by which the admission probability is multiplied per interval over budget.
+        :param min_admission_probability: The lowest admission probability, so that latency keeps being observed.
+        :param is_sheddable: A predicate for requests that may be shed, e.g. `is_static_asset`. All requests are
+            sheddable if not provided.
+        """
+
+        self.latency_budget: float = latency_budget
+        self.max_in_flight: Optional[int] = max_in_flight
+        self.interval: float = interval
+        self.increase_step: float = increase_step
+        self.decrease_factor: float = decrease_factor
+        self.min_admission_probability: float = min_admission_probability
+        self.is_sheddable: Optional[Callable[[ICAPRequest], bool]] = is_sheddable
+
+        self.admission_probability: float = 1.0
+
+        self._interval_start: float = monotonic()
+        self._interval_min_latency: Optional[float] = None
+        self._next_call_id: int = 0
+        # The start times of the handler calls in flight, oldest first.
+        self._call_id_to_start_time: dict[int, float] = {}
+
+    @property
+    def num_in_flight(self) -> int:
+        return len(self._call_id_to_start_time)
+
+    @property
+    def is_shedding(self) -> bool:
+        return self.admission_probability < 1.0
+
+    def _update(self, now: float) -> None:
+        if now - self._interval_start < self.interval:
+            return
+
+        if self._interval_min_latency is not None:
+            over_budget = self._interval_min_latency > self.latency_budget
+        else:
+            # Without finished calls, the latency is observed from the call that has been in flight the longest.
+            oldest_start_time: Optional[float] = next(iter(self._call_id_to_start_time.values()), None)
+            over_budget = oldest_start_time is not None and now - oldest_start_time > self.latency_budget
+
+        if self.max_in_flight is not None and self.num_in_flight > self.max_in_flight:
+            over_budget = True
+
+        was_shedding = self.is_shedding
+
+        if over_budget:
+            self.admission_probability = max(
+                self.admission_probability * self.decrease_factor,
+                self.min_admission_probability
+            )
+        elif was_shedding:
+            self.admission_probability = min(self.admission_probability + self.increase_step, 1.0)
+
+        if self.is_shedding and not was_shedding:
+            LOG.warning(f'The service is over its latency budget of {self.latency_budget} seconds; shedding load.')
+        elif was_shedding and not self.is_shedding:
+            LOG.info('The service is within its latency budget again; no longer shedding load.')
+
+        self._interval_start = now
+        self._interval_min_latency = None
+
+    def should_shed(self, icap_request: ICAPRequest) -> bool:
+        """
+        Determine whether a request should be answered without calling the handler.
+
+        :param icap_request: An ICAP request available for content adaptation.
+        :return: Whether the request should be shed.
+        """
+
+        self._update(now=monotonic())
+
+        if not self.is_shedding:
+            return False
+
+        if self.is_sheddable is not None and not self.is_sheddable(icap_request):
+            return False
+
+        return random() >= self.admission_probability
+
+    def handler_started(self) -> int:
+        """
+        Record that a handler call has started.
+
+        :return: An identifier of the call, to be passed to `handler_finished`.
+        """
+
+        call_id = self._next_call_id
+        self._next_call_id += 1
+        self._call_id_to_start_time[call_id] = monotonic()
+
+        return call_id
+
+    def handler_finished(self, call_id: int) -> None:
+        """
+        Record that a handler call has finished.
+
+        :param call_id: The identifier of the call, as returned by `handler_started`.
+        """
+
+        start_time: float = self._call_id_to_start_time.pop(call_id)
+
+        now = monotonic()
+        latency = now - start_time
+        if self._interval_min_latency is None or latency < self._interval_min_latency:
+            self._interval_min_latency = latency
+
+        self._update(now=now)
@@ -0,0 +1,239 @@
+from __future__ import annotations
+from asyncio import AbstractEventLoop, Task, StreamReader, StreamWriter, current_task, get_running_loop, \
+    start_unix_server
+from asyncio.base_events import Server
+from collections import Counter
+from functools import partial
+from logging import getLogger, Logger
+from os import getpid
+from os.path import join as path_join
+from sys import _current_frames
+from threading import Thread, Lock, Event, get_ident
+from time import monotonic, strftime
+from types import FrameType
+from typing import Final, Optional
+
+from icap_server.listeners import bind_unix_socket
+
+LOG: Final[Logger] = getLogger(__name__)
+
+Stack = tuple[str, ...]
+
+
+def _frame_stack(frame: Optional[FrameType]) -> Stack:
+    stack: list[str] = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+        frame = frame.f_back
+
+    return tuple(reversed(stack))
+
+
+class RequestProfiler:
+    """
+    A stack-sampling profiler for the handling of ICAP requests, that is turned on on demand.
+
+    While active, a background thread samples the stack of the event loop thread. Samples are attributed to the request
+    whose task is running, and only the samples of requests for the selected service are kept. When the profiling
+    ends, the samples are written to a file in the folded stack format, which can be rendered as a flame graph. When
+    inactive, the profiler adds no work to the handling of requests beyond checking `active`.
+    """
+
+    __slots__ = (
+        'output_directory', 'sampling_interval', 'active', '_service_name', '_remaining_requests', '_deadline',
+        '_loop', '_loop_thread_id', '_lock', '_task_to_stacks', '_stacks', '_num_requests', '_stop_event', '_thread'
+    )
+
+    def __init__(self, output_directory: str = '.', sampling_interval: float = 0.001):
+        """
+        :param output_directory: The directory in which to write the profiling results.
+        :param sampling_interval: The number of seconds between stack samples.
+        """
+
+        self.output_directory: str = output_directory
+        self.sampling_interval: float = sampling_interval
+        self.active: bool = False
+
+        self._service_name: Optional[bytes] = None
+        self._remaining_requests: Optional[int] = None
+        self._deadline: Optional[float] = None
+        self._loop: Optional[AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._lock = Lock()
+        self._task_to_stacks: dict[Task, Counter[Stack]] = {}
+        self._stacks: Counter[Stack] = Counter()
+        self._num_requests: int = 0
+        self._stop_event: Optional[Event] = None
+        self._thread: Optional[Thread] = None
+
+    def start(
+        self,
+        duration: Optional[float] = None,
+        num_requests: Optional[int] = None,
+        service_name: Optional[bytes] = None
+    ) -> bool:
+        """
+        Start profiling. Must be called from the event loop thread.
+
+        :param duration: The number of seconds for which to profile. Unlimited if not provided.
+        :param num_requests: The number of requests to profile. Unlimited if not provided.
+        :param service_name: The name of the service whose requests to profile. All services if not provided.
+        :return: Whether profiling was started; `False` if it was already active or its results are still being written.
+        """
+
+        if self.active or (self._thread is not None and self._thread.is_alive()):
+            return False
+
+        self._service_name = service_name
+        self._remaining_requests = num_requests
+        self._deadline = (monotonic() + duration) if duration is not None else None
+        self._loop = get_running_loop()
+        self._loop_thread_id = get_ident()
+        self._task_to_stacks = {}
+        self._stacks = Counter()
+        self._num_requests = 0
+        self._stop_event = Event()
+
+        self.active = True
+        self._thread = Thread(target=self._run, name='icap-request-profiler', daemon=True)
+        self._thread.start()
+
+        LOG.info('Started profiling requests.')
+
+        return True
+
+    def stop(self) -> None:
+        """
+        Stop profiling. The results are written to a file by the sampling thread.
+        """
+
+        self.active = False
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def request_started(self, task: Task) -> None:
+        """
+        Record that a task has started handling a request, so that its samples are attributed to the request.
+
+        :param task: The task handling the request.
+        """
+
+        with self._lock:
+            self._task_to_stacks[task] = Counter()
+
+    def request_finished(self, task: Task, service_name: Optional[bytes]) -> None:
+        """
+        Record that a task has finished handling a request, keeping its samples if the request was for the selected
+        service.
+
+        :param task: The task handling the request.
+        :param service_name: The name of the service the request was for, or `None` if no request was read.
+        """
+
+        with self._lock:
+            stacks = self._task_to_stacks.pop(task, None)
+            if stacks is None or service_name is None or (
+                self._service_name is not None and service_name != self._service_name
+            ):
+                return
+
+            self._stacks.update(stacks)
+            self._num_requests += 1
+
+        if self._remaining_requests is not None:
+            self._remaining_requests -= 1
+            if self._remaining_requests <= 0:
+                self.stop()
+
+    def _sample(self) -> None:
+        task: Optional[Task] = current_task(loop=self._loop)
+        if task is None:
+            return
+
+        if task not in self._task_to_stacks:
+            return
+
+        # The stack is built before taking the lock, which the event loop thread takes when requests start and finish.
+        stack: Stack = _frame_stack(frame=_current_frames().get(self._loop_thread_id))
+
+        with self._lock:
+            if (stacks := self._task_to_stacks.get(task)) is not None:
+                stacks[stack] += 1
+
+    def _run(self) -> None:
+        stop_event: Event = self._stop_event
+
+        while not stop_event.wait(timeout=self.sampling_interval):
+            if self._deadline is not None and monotonic() >= self._deadline:
+                break
+
+            self._sample()
+
+        with self._lock:
+            stacks = self._stacks
+            num_requests = self._num_requests
+            self._task_to_stacks = {}
+
+        self.active = False
+
+        path = path_join(self.output_directory, f'icap-profile-{getpid()}-{strftime("%Y%m%dT%H%M%S")}.folded')
+
+        try:
+            with open(path, 'w') as file:
+                for stack, count in stacks.most_common():
+                    file.write(f'{";".join(stack)} {count}\n')
+        except OSError:
+            LOG.exception('An exception occurred when writing the profiling results.')
+            return
+
+        LOG.info(f'Wrote the profiling results of {num_requests} requests to "{path}".')
+
+
+async def _handle_control_connection(reader: StreamReader, writer: StreamWriter, *, profiler: RequestProfiler) -> None:
+    try:
+        command, *arguments = (await reader.readline()).decode().split()
+    except ValueError:
+        command, arguments = '', []
+
+    try:
+        match command:
+            case 'profile':
+                options = dict(argument.split('=', maxsplit=1) for argument in arguments)
+                started = profiler.start(
+                    duration=float(options['duration']) if 'duration' in options else None,
+                    num_requests=int(options['requests']) if 'requests' in options else None,
+                    service_name=options['service'].encode() if 'service' in options else None
+                )
+                writer.write(b'started\n' if started else b'already active\n')
+            case 'stop':
+                profiler.stop()
+                writer.write(b'stopped\n')
+            case _:
+                writer.write(b'usage: profile [duration=SECONDS] [requests=N] [service=NAME] | stop\n')
+    except ValueError:
+        writer.write(b'bad arguments\n')
+
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_control_server(path: str, profiler: RequestProfiler, mode: int = 0o600) -> Server:
+    """
+    Start a server on a Unix domain socket through which profiling can be controlled.
+
+    A connection sends one line, either `profile [duration=SECONDS] [requests=N] [service=NAME]` or `stop`. The socket
+    file is not removed when the server is closed; see `remove_unix_socket_file`.
+
+    :param path: The path of the Unix domain socket.
+    :param profiler: The profiler to control.
+    :param mode: The permission bits to set on the socket file. Only the owner may connect by default.
+    :return: The control server.
+    """
+
+    return await start_unix_server(
+        client_connected_cb=partial(_handle_control_connection, profiler=profiler),
+        sock=bind_unix_socket(path=path, mode=mode)
+    )
@@ -0,0 +1,155 @@
+from __future__ import annotations
+from asyncio import StreamWriter, Event, wait_for, TimeoutError as AsyncioTimeoutError
+from importlib import import_module, reload as importlib_reload
+from logging import getLogger, Logger
+from sys import modules
+from typing import Final, Optional, Callable, Awaitable
+from types import ModuleType
+
+from icap_server.structures.icap_request import ICAPRequest
+from icap_server.structures.icap_response import generate_istag
+from icap_server.structures.content_adaptation_response import ContentAdaptationResponse
+from icap_server.load_shedding import LoadShedder
+from icap_server.profiling import RequestProfiler
+
+LOG: Final[Logger] = getLogger(__name__)
+
+ServiceHandler = Callable[[ICAPRequest], Awaitable[ContentAdaptationResponse]]
+
+
+def reimport_handlers(service_name_to_handler: dict[bytes, ServiceHandler]) -> dict[bytes, ServiceHandler]:
+    """
+    Re-import the modules in which service handlers are defined and resolve the handlers anew.
+
+    Handlers defined in the `__main__` module cannot be re-imported and are kept as they are.
+
+    :param service_name_to_handler: A map of handlers for ICAP service names.
+    :return: A map of the re-imported handlers for the same ICAP service names.
+    """
+
+    name_to_reloaded_module: dict[str, ModuleType] = {}
+    reimported_service_name_to_handler: dict[bytes, ServiceHandler] = {}
+
+    for service_name, handler in service_name_to_handler.items():
+        module_name: Optional[str] = getattr(handler, '__module__', None)
+        if module_name is None or module_name == '__main__':
+            reimported_service_name_to_handler[service_name] = handler
+            continue
+
+        if (module := name_to_reloaded_module.get(module_name)) is None:
+            module = importlib_reload(modules[module_name]) if module_name in modules else import_module(module_name)
+            name_to_reloaded_module[module_name] = module
+
+        reimported_handler = module
+        for attribute_name in handler.__qualname__.split('.'):
+            reimported_handler = getattr(reimported_handler, attribute_name)
+
+        reimported_service_name_to_handler[service_name] = reimported_handler
+
+    return reimported_service_name_to_handler
+
+
+class ServerContext:
+    """
+    State shared by the connections of an ICAP server: the service handlers, the ISTag, and the open connections.
+    """
+
+    __slots__ = (
+        'service_name_to_handler', 'istag', 'max_decoded_body_size', 'service_name_to_load_shedder', 'profiler',
+        'draining', '_writer_to_busy', '_num_busy', '_all_idle'
+    )
+
+    def __init__(
+        self,
+        service_name_to_handler: dict[bytes, ServiceHandler],
+        istag: Optional[bytes] = None,
+        max_decoded_body_size: Optional[int] = None,
+        service_name_to_load_shedder: Optional[dict[bytes, LoadShedder]] = None,
+        profiler: Optional[RequestProfiler] = None
+    ):
+        """
+        :param service_name_to_handler: A map of handlers for ICAP service names.
+        :param istag: The ISTag with which to respond. A random one is generated if not provided.
+        :param max_decoded_body_size: If provided, content-encoded response bodies are decoded before being passed to
+            the handlers, unless their decoded size would exceed this number of bytes. The encapsulated response header
+            is passed as it was received, so that a handler sees a decoded body under a header that still has the
+            original `Content-Encoding` and `Content-Length`. The body is re-encoded, and its `Content-Length` updated,
+            when the response is written.
+        :param service_name_to_load_shedder: A map of controllers that shed load for ICAP service names whose handlers
+            are over their latency budgets.
+        :param profiler: A profiler of the handling of requests, that can be turned on on demand.
+        """
+
+        self.service_name_to_handler: dict[bytes, ServiceHandler] = service_name_to_handler
+        self.istag: bytes = istag or generate_istag()
+        self.max_decoded_body_size: Optional[int] = max_decoded_body_size
+        self.service_name_to_load_shedder: dict[bytes, LoadShedder] = service_name_to_load_shedder or {}
+        self.profiler: Optional[RequestProfiler] = profiler
+        self.draining: bool = False
+
+        self._writer_to_busy: dict[StreamWriter, bool] = {}
+        self._num_busy: int = 0
+        self._all_idle = Event()
+        self._all_idle.set()
+
+    @property
+    def num_connections(self) -> int:
+        return len(self._writer_to_busy)
+
+    def reload(self, service_name_to_handler: Optional[dict[bytes, ServiceHandler]] = None) -> None:
+        """
+        Replace the service handlers and bump the ISTag, so that clients invalidate cached adaptations.
+
+        :param service_name_to_handler: A new map of handlers for ICAP service names. The current handlers are kept if
+            not provided.
+        """
+
+        if service_name_to_handler is not None:
+            self.service_name_to_handler = service_name_to_handler
+
+        self.istag = generate_istag()
+
+    def connection_opened(self, writer: StreamWriter) -> None:
+        self._writer_to_busy[writer] = False
+
+    def connection_closed(self, writer: StreamWriter) -> None:
+        if self._writer_to_busy.pop(writer, False):
+            self._request_done()
+
+    def request_started(self, writer: StreamWriter) -> None:
+        self._writer_to_busy[writer] = True
+        self._num_busy += 1
+        self._all_idle.clear()
+
+    def request_finished(self, writer: StreamWriter) -> None:
+        if self._writer_to_busy.get(writer):
+            self._writer_to_busy[writer] = False
+            self._request_done()
+
+    def _request_done(self) -> None:
+        self._num_busy -= 1
+        if self._num_busy == 0:
+            self._all_idle.set()
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """
+        Close idle connections, wait for in-flight requests to finish, and then close the remaining connections.
+
+        Connections that finish a request while draining are closed by their handlers rather than kept alive.
+
+        :param timeout: The maximum number of seconds to wait for in-flight requests to finish.
+        """
+
+        self.draining = True
+
+        for writer, busy in list(self._writer_to_busy.items()):
+            if not busy:
+                writer.close()
+
+        try:
+            await wait_for(self._all_idle.wait(), timeout=timeout)
+        except AsyncioTimeoutError:
+            LOG.warning(f'{self._num_busy} in-flight requests did not finish within the drain timeout.')
+
+        for writer in list(self._writer_to_busy):
+            writer.close()
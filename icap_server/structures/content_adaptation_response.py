@@ -1,11 +1,12 @@
 from dataclasses import dataclass
 
 from icap_server.structures.encapsulated_data import EncapsulatedData
+from icap_server.structures.headers import Headers
 
 
-@dataclass
+@dataclass(slots=True)
 class ContentAdaptationResponse:
     content: EncapsulatedData
     icap_response_code: int
-    icap_response_headers: dict[bytes, list[bytes]]
+    icap_response_headers: Headers
     content_was_altered: bool
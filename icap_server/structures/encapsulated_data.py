@@ -6,13 +6,16 @@ from icap_server.structures.encapsulated_entity_name import EncapsulatedEntityNa
 from icap_server.exceptions import UnexpectedCase
 
 
-@dataclass
+@dataclass(slots=True)
 class EncapsulatedData:
     request_header: Optional[bytes] = None
     response_header: Optional[bytes] = None
     request_body: Optional[bytes] = None
     response_body: Optional[bytes] = None
     options_body: Optional[bytes] = None
+    # The content encoding that was removed from `response_body` when it was read, and the body as it was received.
+    response_body_content_encoding: Optional[bytes] = None
+    encoded_response_body: Optional[bytes] = None
 
     @classmethod
     def from_entries(cls, entries: Iterable[tuple[EncapsulatedEntityName, bytes]]) -> EncapsulatedData:
@@ -0,0 +1,184 @@
+from __future__ import annotations
+from collections.abc import MutableMapping, ItemsView
+from typing import Optional, Iterable, Iterator, Mapping, Union, Final
+
+# Common ICAP header names, mapped from their lowercase key to the key and the name in its usual spelling, so that the
+# keys are shared between messages and the usual spellings need not be stored per message.
+_KNOWN_KEY_TO_KEY_AND_NAME: Final[dict[bytes, tuple[bytes, bytes]]] = {
+    name.lower(): (name.lower(), name)
+    for name in (
+        b'Allow', b'Authorization', b'Cache-Control', b'Connection', b'Date', b'Encapsulated', b'Expires', b'From',
+        b'Host', b'ISTag', b'Max-Connections', b'Methods', b'Opt-body-type', b'Options-TTL', b'Pragma', b'Preview',
+        b'Referer', b'Service', b'Service-ID', b'Trailer', b'Transfer-Complete', b'Transfer-Ignore',
+        b'Transfer-Preview', b'Upgrade', b'User-Agent', b'X-Authenticated-Groups', b'X-Authenticated-User',
+        b'X-Client-IP', b'X-Client-Username', b'X-Include', b'X-Server-IP'
+    )
+}
+
+
+class HeadersItemsView(ItemsView):
+    """
+    A view of the header names, in the spelling with which they are serialized, and their values.
+    """
+
+    __slots__ = ()
+
+    _mapping: Headers
+
+    def __iter__(self) -> Iterator[tuple[bytes, list[bytes]]]:
+        headers: Headers = self._mapping
+        for key, values in headers._values.items():
+            yield headers._name(key), values
+
+
+class Headers(MutableMapping[bytes, list[bytes]]):
+    """
+    An ordered, case-insensitive multidict of header names and values.
+
+    Headers are stored by lowercase key, with all of their values in one list. The spelling with which a header was
+    first added is only stored if it differs from the spelling that would otherwise be serialized: the usual spelling
+    for common ICAP header names, and the lowercase key for other names. The container serializes directly to header
+    lines.
+    """
+
+    __slots__ = ('_values', '_names')
+
+    def __init__(
+        self,
+        headers: Optional[Union[Headers, Mapping[bytes, list[bytes]], Iterable[tuple[bytes, bytes]]]] = None
+    ):
+        self._values: dict[bytes, list[bytes]] = {}
+        self._names: Optional[dict[bytes, bytes]] = None
+
+        if headers is None:
+            return
+
+        if isinstance(headers, Headers):
+            self._values = {key: list(values) for key, values in headers._values.items()}
+            self._names = dict(headers._names) if headers._names is not None else None
+        elif isinstance(headers, Mapping):
+            for name, values in headers.items():
+                self.extend(name=name, values=values)
+        else:
+            for name, value in headers:
+                self.add(name=name, value=value)
+
+    @staticmethod
+    def _key(name: bytes) -> bytes:
+        key: bytes = name.lower()
+        if (known_key_and_name := _KNOWN_KEY_TO_KEY_AND_NAME.get(key)) is not None:
+            return known_key_and_name[0]
+
+        return key
+
+    def _set_name(self, key: bytes, name: bytes) -> None:
+        known_key_and_name: Optional[tuple[bytes, bytes]] = _KNOWN_KEY_TO_KEY_AND_NAME.get(key)
+        default_name: bytes = known_key_and_name[1] if known_key_and_name is not None else key
+
+        if name != default_name:
+            if self._names is None:
+                self._names = {}
+            self._names[key] = name
+        elif self._names is not None:
+            self._names.pop(key, None)
+
+    def _name(self, key: bytes) -> bytes:
+        if self._names is not None and (name := self._names.get(key)) is not None:
+            return name
+
+        if (known_key_and_name := _KNOWN_KEY_TO_KEY_AND_NAME.get(key)) is not None:
+            return known_key_and_name[1]
+
+        return key
+
+    def add(self, name: bytes, value: bytes) -> None:
+        """
+        Add a value to a header, creating the header if it does not exist.
+
+        :param name: The name of the header.
+        :param value: The value to add.
+        """
+
+        if (values := self._values.get(key := self._key(name))) is None:
+            self._values[key] = [value]
+            self._set_name(key=key, name=name)
+        else:
+            values.append(value)
+
+    def extend(self, name: bytes, values: Iterable[bytes]) -> None:
+        """
+        Add multiple values to a header, creating the header if it does not exist.
+
+        :param name: The name of the header.
+        :param values: The values to add.
+        """
+
+        if (existing_values := self._values.get(key := self._key(name))) is None:
+            self._values[key] = list(values)
+            self._set_name(key=key, name=name)
+        else:
+            existing_values.extend(values)
+
+    def get(self, name: bytes, default=None):
+        return self._values.get(self._key(name), default)
+
+    def get_one(self, name: bytes, default: Optional[bytes] = None) -> Optional[bytes]:
+        """
+        Retrieve the first value of a header.
+
+        :param name: The name of the header.
+        :param default: A value to return if the header does not exist.
+        :return: The first value of the header, or `default` if the header does not exist.
+        """
+
+        if not (values := self._values.get(self._key(name))):
+            return default
+
+        return values[0]
+
+    def __getitem__(self, name: bytes) -> list[bytes]:
+        return self._values[self._key(name)]
+
+    def __setitem__(self, name: bytes, values: list[bytes]) -> None:
+        # The list is stored as is, so that e.g. `headers.setdefault(name, []).append(value)` adds to the header.
+        key = self._key(name)
+        self._values[key] = values
+        self._set_name(key=key, name=name)
+
+    def __delitem__(self, name: bytes) -> None:
+        key = self._key(name)
+        del self._values[key]
+        if self._names is not None:
+            self._names.pop(key, None)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, bytes) and self._key(name) in self._values
+
+    def __iter__(self) -> Iterator[bytes]:
+        for key in self._values:
+            yield self._name(key)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def items(self) -> HeadersItemsView:
+        return HeadersItemsView(self)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Headers):
+            return self._values == other._values
+
+        if isinstance(other, Mapping):
+            return self == Headers(other)
+
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({list(self.items())!r})'
+
+    def __bytes__(self) -> bytes:
+        return b''.join(
+            b''.join((self._name(key), b': ', value, b'\r\n'))
+            for key, values in self._values.items()
+            for value in values
+        )
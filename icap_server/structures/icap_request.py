@@ -1,23 +1,26 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Callable
 from asyncio import StreamReader
 from itertools import zip_longest
-from collections import defaultdict
 
 from icap_server.structures.icap_request_line import ICAPRequestLine
 from icap_server.structures.encapsulated_data import EncapsulatedData
 from icap_server.structures.encapsulated_entity_name import EncapsulatedEntityName
 from icap_server.structures.icap_method import ICAPMethod
+from icap_server.structures.headers import Headers
+from icap_server.buffer_pool import BufferAccumulator, BODY_BUFFER_POOL
+from icap_server.content_coding import ContentDecoder, get_content_encoding, is_supported_content_encoding
 from icap_server.exceptions import MissingEncapsulatedHeaderError, MultipleHeadersError, \
     BadEncapsulatedEntityNameError, DuplicateEncapsulatedEntityNamesError, EncapsulatedEntityOffsetIsNotIntegerError, \
-    NegativeEncapsulatedEntityOffsetError, NonIncreasingEncapsulatedEntityOffsetError
+    NegativeEncapsulatedEntityOffsetError, NonIncreasingEncapsulatedEntityOffsetError, DecodedBodyTooLargeError, \
+    ContentDecodingError
 
 
-@dataclass
+@dataclass(slots=True)
 class ICAPRequest:
     request_line: ICAPRequestLine
-    headers: dict[bytes, list[bytes]]
+    headers: Headers
     body: EncapsulatedData
 
     @staticmethod
@@ -88,7 +91,22 @@ class ICAPRequest:
         return name_to_offset
 
     @staticmethod
-    async def _read_encapsulated_data(reader: StreamReader, method: ICAPMethod, encapsulated_header_values: Optional[list[bytes]]) -> EncapsulatedData:
+    async def _read_encapsulated_data(
+        reader: StreamReader,
+        method: ICAPMethod,
+        encapsulated_header_values: Optional[list[bytes]],
+        max_decoded_body_size: Optional[int] = None
+    ) -> EncapsulatedData:
+        """
+        Read the encapsulated data of an ICAP request.
+
+        :param reader: A reader from which to read the encapsulated data.
+        :param method: The ICAP method of the request.
+        :param encapsulated_header_values: The values of the ICAP `Encapsulated` header.
+        :param max_decoded_body_size: If provided, a content-encoded response body is decoded as it is read, unless its
+            decoded size would exceed this number of bytes.
+        :return: The encapsulated data.
+        """
 
         encapsulated_entity_name_to_offset: dict[EncapsulatedEntityName, int] = ICAPRequest._parse_encapsulated_header(
             encapsulated_header_values=encapsulated_header_values,
@@ -96,6 +114,8 @@ class ICAPRequest:
         )
 
         entries: list[tuple[EncapsulatedEntityName, bytes]] = []
+        content_decoder: Optional[ContentDecoder] = None
+        encoded_response_body: Optional[bytes] = None
 
         bytes_read = 0
         for entity_name, offset in zip_longest(encapsulated_entity_name_to_offset.keys(), list(encapsulated_entity_name_to_offset.values())[1:], fillvalue=None):
@@ -103,7 +123,14 @@ class ICAPRequest:
                 continue
 
             if offset is None:
-                chunks_data = bytearray()
+                if entity_name is EncapsulatedEntityName.RESBODY and max_decoded_body_size is not None:
+                    content_decoder = ICAPRequest._make_response_body_decoder(
+                        entries=entries,
+                        max_decoded_body_size=max_decoded_body_size
+                    )
+
+                chunks_data = BufferAccumulator(buffer_pool=BODY_BUFFER_POOL)
+                decoded_chunks_data = bytearray()
                 while True:
                     chunk_line = await reader.readline()
                     if not chunk_line:
@@ -118,10 +145,26 @@ class ICAPRequest:
                     if chunk_data == b'':
                         break
 
-                    chunks_data += chunk_data
-
-                if chunks_data:
-                    entries.append((entity_name, bytes(chunks_data)))
+                    chunks_data.append(data=chunk_data)
+
+                    if content_decoder is not None:
+                        try:
+                            decoded_chunks_data += content_decoder.decompress(data=chunk_data)
+                        except (DecodedBodyTooLargeError, ContentDecodingError):
+                            content_decoder = None
+                            decoded_chunks_data = bytearray()
+
+                if content_decoder is not None:
+                    try:
+                        decoded_chunks_data += content_decoder.flush()
+                    except (DecodedBodyTooLargeError, ContentDecodingError):
+                        content_decoder = None
+
+                if content_decoder is not None:
+                    encoded_response_body = chunks_data.take()
+                    entries.append((entity_name, bytes(decoded_chunks_data)))
+                elif chunks_data.length:
+                    entries.append((entity_name, chunks_data.take()))
             else:
                 bytes_to_read = offset - bytes_read
                 bytes_read += bytes_to_read
@@ -129,18 +172,50 @@ class ICAPRequest:
                 entries.append((entity_name, (await reader.readexactly(bytes_to_read - 2))))
                 await reader.readexactly(2)
 
-        return EncapsulatedData.from_entries(entries=entries)
+        encapsulated_data = EncapsulatedData.from_entries(entries=entries)
+
+        if content_decoder is not None:
+            encapsulated_data.response_body_content_encoding = content_decoder.content_encoding
+            encapsulated_data.encoded_response_body = encoded_response_body
+
+        return encapsulated_data
+
+    @staticmethod
+    def _make_response_body_decoder(
+        entries: list[tuple[EncapsulatedEntityName, bytes]],
+        max_decoded_body_size: int
+    ) -> Optional[ContentDecoder]:
+        """
+        Make a decoder for a response body based on the `Content-Encoding` of the encapsulated response header.
+
+        :param entries: The encapsulated entities read so far.
+        :param max_decoded_body_size: The maximum number of bytes the decoded body may have.
+        :return: A decoder, or `None` if the body is not encoded with a supported content encoding.
+        """
+
+        response_header: Optional[bytes] = next(
+            (value for name, value in entries if name is EncapsulatedEntityName.RES_HDR),
+            None
+        )
+        if not response_header:
+            return None
+
+        content_encoding: Optional[bytes] = get_content_encoding(http_header=response_header)
+        if content_encoding is None or not is_supported_content_encoding(content_encoding=content_encoding):
+            return None
+
+        return ContentDecoder(content_encoding=content_encoding, max_output_size=max_decoded_body_size)
 
     @staticmethod
-    async def _read_icap_headers(reader: StreamReader) -> dict[bytes, list[bytes]]:
+    async def _read_icap_headers(reader: StreamReader) -> Headers:
         """
         Read header name and values from a reader.
 
         :param reader: A reader from which to read header lines.
-        :return: ICAP headers as a `dict`.
+        :return: ICAP headers as a case-insensitive multidict.
         """
 
-        headers: dict[bytes, list[bytes]] = defaultdict(list)
+        headers = Headers()
 
         # TODO: Add timeout?
         header_line_bytes: bytes
@@ -149,20 +224,38 @@ class ICAPRequest:
             value: bytes
 
             name, value = header_line_bytes.split(sep=b': ', maxsplit=1)
-            headers[name.lower()].append(value)
+            headers.add(name=name, value=value)
 
-        return dict(headers)
+        return headers
 
     # TODO: Add timeout parameter?
     @classmethod
-    async def from_reader(cls, reader: StreamReader) -> Optional[ICAPRequest]:
+    async def from_reader(
+        cls,
+        reader: StreamReader,
+        max_decoded_body_size: Optional[int] = None,
+        on_request_line: Optional[Callable[[ICAPRequestLine], None]] = None
+    ) -> Optional[ICAPRequest]:
+        """
+        Read an ICAP request from a stream.
+
+        :param reader: The stream from which to read the request.
+        :param max_decoded_body_size: If provided, a content-encoded response body is decoded, unless its decoded size
+            would exceed this number of bytes.
+        :param on_request_line: A function called with the request line as soon as it has been read, before the rest of
+            the request is received.
+        :return: The request, or `None` if the stream ended before a request line.
+        """
 
         request_line_bytes = await reader.readline()
         if not request_line_bytes:
             return None
 
         request_line = ICAPRequestLine.from_bytes(data=request_line_bytes)
-        headers: dict[bytes, list[bytes]] = await cls._read_icap_headers(reader=reader)
+        if on_request_line is not None:
+            on_request_line(request_line)
+
+        headers: Headers = await cls._read_icap_headers(reader=reader)
 
         return cls(
             request_line=request_line,
@@ -170,6 +263,7 @@ class ICAPRequest:
             body=await cls._read_encapsulated_data(
                 reader=reader,
                 method=request_line.method,
-                encapsulated_header_values=headers.get(b'encapsulated')
+                encapsulated_header_values=headers.get(b'encapsulated'),
+                max_decoded_body_size=max_decoded_body_size
             )
         )
@@ -8,7 +8,7 @@ from icap_server.structures.icap_method import ICAPMethod
 from icap_server.exceptions import BadICAPMethodError, MalformedICAPRequestLine
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ICAPRequestLine:
     method: ICAPMethod
     uri: ParseResultBytes
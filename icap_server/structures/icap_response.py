@@ -1,6 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Union, Mapping
 from string import ascii_letters, digits
 from random import choices as random_choices
 
@@ -9,27 +9,50 @@ from icap_server.structures.icap_response_body import ICAPResponseBody
 from icap_server.structures.icap_method import ICAPMethod
 from icap_server.structures.encapsulated_data import EncapsulatedData
 from icap_server.structures.encapsulated_entity_name import EncapsulatedEntityName
+from icap_server.structures.headers import Headers
 from icap_server.exceptions import UnexpectedCase
 
 
-@dataclass
+def generate_istag() -> bytes:
+    """
+    Generate a random ICAP service tag (ISTag).
+
+    :return: A random ISTag value.
+    """
+
+    return ''.join(random_choices(population=(ascii_letters + digits), k=30)).encode()
+
+
+@dataclass(slots=True)
 class ICAPResponse:
     status_line: ICAPStatusLine
     header: Optional[bytes] = None
     body: Optional[ICAPResponseBody] = None
 
     @staticmethod
-    def _build_header_bytes(headers_map: dict[bytes, list[bytes]]) -> bytes:
+    def _build_header_bytes(headers_map: Headers) -> bytes:
+        return bytes(headers_map)
 
-        header = bytearray()
-        for header_name, header_values in headers_map.items():
-            for header_value in header_values:
-                header += (header_name + b': ' + header_value + b'\r\n')
+    def parts(self) -> list[bytes]:
+        """
+        Produce the pieces of the serialized response, without concatenating them.
 
-        return bytes(header)
+        :return: The pieces of the serialized response, suitable for `StreamWriter.writelines`.
+        """
+
+        parts: list[bytes] = [bytes(self.status_line)]
+
+        if self.header:
+            parts.append(self.header)
+        parts.append(b'\r\n')
+
+        if self.body:
+            parts.extend(self.body.parts())
+
+        return parts
 
     def __bytes__(self) -> bytes:
-        return bytes(self.status_line) + (self.header or b'') + b'\r\n' + (bytes(self.body) if self.body else b'')
+        return b''.join(self.parts())
 
     @classmethod
     def make(
@@ -37,8 +60,9 @@ class ICAPResponse:
         method: ICAPMethod,
         encapsulated_data: EncapsulatedData,
         status_code: int,
-        headers: dict[bytes, list[bytes]],
-        add_required_headers: bool = True
+        headers: Union[Headers, Mapping[bytes, list[bytes]]],
+        add_required_headers: bool = True,
+        istag: Optional[bytes] = None
     ) -> ICAPResponse:
         """
 
@@ -47,11 +71,15 @@ class ICAPResponse:
         :param status_code:
         :param headers:
         :param add_required_headers:
+        :param istag: The ISTag to add if none is present in `headers`. A random one is generated if not provided.
         :return:
         """
 
+        if not isinstance(headers, Headers):
+            headers = Headers(headers)
+
         if b'ISTag' not in headers and add_required_headers:
-            headers[b'ISTag'] = [''.join(random_choices(population=(ascii_letters + digits), k=30)).encode()]
+            headers[b'ISTag'] = [istag or generate_istag()]
 
         if status_code != 204:
             match method:
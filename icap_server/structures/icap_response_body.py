@@ -1,27 +1,58 @@
-from dataclasses import dataclass, InitVar
-from typing import Optional
+from dataclasses import dataclass
+from typing import Optional, Final
 
 from icap_server.structures.encapsulated_entity_name import EncapsulatedEntityName
 from icap_server.exceptions import HeaderValueButMissingHeaderEntityNameError
 
 
-@dataclass
+CRLF: Final[bytes] = b'\r\n'
+LAST_CHUNK: Final[bytes] = b'\r\n0\r\n\r\n'
+
+
+@dataclass(slots=True)
 class ICAPResponseBody:
+    """
+    The encapsulated part of an ICAP response.
+
+    A body passed as `encapsulated_body` is stored as is and only chunk-encoded when serialized, by `parts`, so that it
+    is not copied. `body` is not derived from it; it only holds an already chunk-encoded body passed by the caller. The
+    serialized form of a body passed as `encapsulated_body` is obtained with `b''.join(parts())` or `bytes()`.
+    """
+
     header: Optional[bytes] = None
+    # An already chunk-encoded body.
     body: Optional[bytes] = None
-    encapsulated_body: InitVar[bytes] = None
+    # A body to be chunk-encoded when serialized, unless `body` is provided.
+    encapsulated_body: Optional[bytes] = None
+
+    def parts(self) -> list[bytes]:
+        """
+        Produce the pieces of the serialized body, without concatenating them.
+
+        :return: The pieces of the serialized body.
+        """
+
+        parts: list[bytes] = []
+
+        if self.header:
+            parts.append(self.header)
+            parts.append(CRLF)
+
+        if self.body is not None:
+            parts.append(self.body)
+        elif self.encapsulated_body:
+            parts.append(b'%x\r\n' % len(self.encapsulated_body))
+            parts.append(self.encapsulated_body)
+            parts.append(LAST_CHUNK)
 
-    def __post_init__(self, encapsulated_body: Optional[bytes]):
-        if self.body is None and encapsulated_body:
-            self.body = f'{len(encapsulated_body):x}'.encode() + b'\r\n' + encapsulated_body + b'\r\n' + b'0\r\n\r\n'
+        return parts
 
     def __bytes__(self) -> bytes:
-        return (
-            ((self.header + b'\r\n') if self.header else b'') + (self.body or b'')
-        )
+        return b''.join(self.parts())
 
     def make_encapsulated_header(self, body_entity_name: Optional[bytes] = None, header_entity_name: Optional[bytes] = None) -> bytes:
-        body_entity_name: bytes = body_entity_name if self.body else EncapsulatedEntityName.NULLBODY.value
+        has_body: bool = bool(self.body) if self.body is not None else bool(self.encapsulated_body)
+        body_entity_name: bytes = body_entity_name if has_body else EncapsulatedEntityName.NULLBODY.value
 
         if self.header:
             if header_entity_name is None:
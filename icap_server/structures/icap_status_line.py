@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from typing import Optional, ClassVar
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ICAPStatusLine:
     status_code: int
     reason_phrase: Optional[bytes] = None
@@ -50,7 +50,13 @@ class ICAPStatusLine:
         505: (b'Protocol Version Not Supported', b'Cannot fulfill request.'),
     }
 
+    _DEFAULT_STATUS_LINES: ClassVar[dict[int, bytes]] = {
+        status_code: b'ICAP/1.0 %d %s\r\n' % (status_code, reason_phrase)
+        for status_code, (reason_phrase, _) in STATUS_CODE_MAP.items()
+    }
+
     def __bytes__(self) -> bytes:
-        reason_phrase = self.reason_phrase or self.STATUS_CODE_MAP[self.status_code][0]
+        if self.reason_phrase is None:
+            return self._DEFAULT_STATUS_LINES[self.status_code]
 
-        return b'ICAP/1.0 ' + str(self.status_code).encode() + b' ' + reason_phrase + b'\r\n'
+        return b'ICAP/1.0 ' + str(self.status_code).encode() + b' ' + self.reason_phrase + b'\r\n'
@@ -0,0 +1,156 @@
+from asyncio import StreamReader, run as asyncio_run
+from gc import collect as gc_collect
+from tracemalloc import start as tracemalloc_start, stop as tracemalloc_stop, get_traced_memory, reset_peak, \
+    take_snapshot
+from typing import Final, Callable, Awaitable, Any
+
+from icap_server.buffer_pool import BufferPool, BODY_BUFFER_POOL
+from icap_server.structures.icap_request import ICAPRequest
+from icap_server.structures.icap_response import ICAPResponse
+from icap_server.structures.headers import Headers
+
+HTTP_REQUEST_HEADER: Final[bytes] = (
+    b'POST http://example.com/upload HTTP/1.1\r\n'
+    b'Host: example.com\r\n'
+    b'Content-Type: application/octet-stream\r\n'
+    b'\r\n'
+)
+
+NUM_REQUESTS: Final[int] = 500
+
+# The peak number of bytes that the handling of a small REQMOD request may allocate, with the message objects.
+MAX_SMALL_REQUEST_PEAK_SIZE: Final[int] = 4 * 1024
+
+# The number of bytes that the parsing and serialization of a message may allocate beyond its body.
+MAX_OVERHEAD_SIZE: Final[int] = 16 * 1024
+
+
+def make_reqmod_message(body_chunks: list[bytes]) -> bytes:
+    return (
+        b'REQMOD icap://127.0.0.1:1344/echo ICAP/1.0\r\n'
+        b'Host: 127.0.0.1:1344\r\n'
+        b'Allow: 204\r\n'
+        b'Encapsulated: req-hdr=0, req-body=%d\r\n'
+        b'\r\n' % len(HTTP_REQUEST_HEADER)
+    ) + HTTP_REQUEST_HEADER + b''.join(b'%x\r\n%s\r\n' % (len(chunk), chunk) for chunk in body_chunks) + b'0\r\n\r\n'
+
+
+async def round_trip(reader: StreamReader) -> list[bytes]:
+    icap_request = await ICAPRequest.from_reader(reader=reader)
+
+    return ICAPResponse.make(
+        method=icap_request.request_line.method,
+        encapsulated_data=icap_request.body,
+        status_code=200,
+        headers=Headers(),
+        istag=b'test'
+    ).parts()
+
+
+def make_reader(data: bytes) -> StreamReader:
+    reader = StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+async def measure_peak_size(data: bytes, operation: Callable[[StreamReader], Awaitable[Any]]) -> tuple[int, Any]:
+    reader = make_reader(data=data)
+
+    tracemalloc_start()
+    try:
+        start_size, _ = get_traced_memory()
+        reset_peak()
+        result = await operation(reader)
+        _, peak_size = get_traced_memory()
+    finally:
+        tracemalloc_stop()
+
+    return peak_size - start_size, result
+
+
+def test_small_requests_allocate_little_in_steady_state():
+    message = make_reqmod_message(body_chunks=[b'field=value&other=1'])
+    # The readers are made up front, so that their buffers are not counted, and are dropped once read.
+    readers = [make_reader(data=message) for _ in range(NUM_REQUESTS)]
+
+    async def handle_requests() -> tuple[float, int]:
+        # Warm up caches and pools, so that only the steady state is measured.
+        for _ in range(NUM_REQUESTS):
+            await round_trip(reader=make_reader(data=message))
+
+        total_peak_size = 0
+
+        gc_collect()
+
+        tracemalloc_start()
+        try:
+            start_snapshot = take_snapshot()
+            while readers:
+                reader = readers.pop()
+                start_size, _ = get_traced_memory()
+                reset_peak()
+                await round_trip(reader=reader)
+                del reader
+                _, peak_size = get_traced_memory()
+                total_peak_size += peak_size - start_size
+            gc_collect()
+            num_retained_blocks = sum(
+                statistic.count_diff for statistic in take_snapshot().compare_to(start_snapshot, 'filename')
+            )
+        finally:
+            tracemalloc_stop()
+
+        return total_peak_size / NUM_REQUESTS, num_retained_blocks
+
+    peak_size_per_request, num_retained_blocks = asyncio_run(handle_requests())
+
+    assert peak_size_per_request < MAX_SMALL_REQUEST_PEAK_SIZE
+    # Nothing accumulates across requests, besides the snapshot's own bookkeeping.
+    assert num_retained_blocks < NUM_REQUESTS // 10
+
+
+def test_single_chunk_body_is_not_copied():
+    body = bytes(range(256)) * 256
+    message = make_reqmod_message(body_chunks=[body])
+
+    async def read_body(reader: StreamReader) -> bytes:
+        return await reader.readexactly(len(body))
+
+    # Reading the body from a stream, which the round trip cannot avoid, is the reference. (`readexactly` itself copies
+    # the data twice on some Python versions.)
+    read_body_peak_size, _ = asyncio_run(measure_peak_size(data=body + b'\r\n', operation=read_body))
+
+    # Warm up caches and pools, so that only the allocations of a round trip are measured.
+    asyncio_run(measure_peak_size(data=message, operation=round_trip))
+    peak_size, parts = asyncio_run(measure_peak_size(data=message, operation=round_trip))
+
+    assert body in parts
+    assert peak_size < read_body_peak_size + MAX_OVERHEAD_SIZE
+
+
+def test_multi_chunk_body_is_gathered_in_pooled_buffer(monkeypatch):
+    body = bytes(range(256)) * 256
+    message = make_reqmod_message(body_chunks=[body[i:i + 4096] for i in range(0, len(body), 4096)])
+
+    acquired_sizes: list[int] = []
+    acquire = BufferPool.acquire
+
+    def counting_acquire(self: BufferPool, min_size: int) -> bytearray:
+        buffer = acquire(self, min_size=min_size)
+        if self is BODY_BUFFER_POOL:
+            acquired_sizes.append(len(buffer))
+        return buffer
+
+    monkeypatch.setattr(BufferPool, 'acquire', counting_acquire)
+
+    # Warm up the pool, so that the buffers of the measured round trip are reused rather than allocated.
+    asyncio_run(measure_peak_size(data=message, operation=round_trip))
+    acquired_sizes.clear()
+
+    peak_size, parts = asyncio_run(measure_peak_size(data=message, operation=round_trip))
+
+    assert body in parts
+    assert acquired_sizes
+    # The gathered body is allocated once, as the `bytes` handed to the handler; the pooled buffers are reused.
+    assert peak_size < len(body) + MAX_OVERHEAD_SIZE
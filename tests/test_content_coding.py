@@ -0,0 +1,99 @@
+from gzip import compress as gzip_compress, decompress as gzip_decompress
+from typing import Final, Optional
+from zlib import decompress as zlib_decompress
+
+from icap_server.content_coding import restore_response_body_encoding
+from icap_server.structures.encapsulated_data import EncapsulatedData
+
+BODY: Final[bytes] = b'<html><body>' + b'hello ' * 100 + b'</body></html>'
+ENCODED_BODY: Final[bytes] = gzip_compress(BODY)
+
+
+def make_response_header(content_encoding: Optional[bytes], content_length: int) -> bytes:
+    return (
+        b'HTTP/1.1 200 OK\r\n'
+        b'Content-Type: text/html\r\n'
+        + (b'Content-Encoding: %s\r\n' % content_encoding if content_encoding is not None else b'')
+        + b'Content-Length: %d\r\n' % content_length
+        + b'\r\n'
+    )
+
+
+def make_decoded_encapsulated_data(response_header: bytes, response_body: bytes = BODY) -> EncapsulatedData:
+    return EncapsulatedData(
+        response_header=response_header,
+        response_body=response_body,
+        response_body_content_encoding=b'gzip',
+        encoded_response_body=ENCODED_BODY
+    )
+
+
+def test_unaltered_body_is_replaced_with_received_body():
+    response_header = make_response_header(content_encoding=b'gzip', content_length=len(ENCODED_BODY))
+
+    encapsulated_data = restore_response_body_encoding(
+        encapsulated_data=make_decoded_encapsulated_data(response_header=response_header),
+        content_was_altered=False
+    )
+
+    assert encapsulated_data.response_body is ENCODED_BODY
+    assert encapsulated_data.response_header == response_header
+    assert encapsulated_data.response_body_content_encoding is None
+    assert encapsulated_data.encoded_response_body is None
+
+
+def test_altered_body_is_re_encoded():
+    altered_body = BODY.replace(b'hello', b'bye')
+
+    encapsulated_data = restore_response_body_encoding(
+        encapsulated_data=make_decoded_encapsulated_data(
+            response_header=make_response_header(content_encoding=b'gzip', content_length=len(ENCODED_BODY)),
+            response_body=altered_body
+        ),
+        content_was_altered=True
+    )
+
+    assert gzip_decompress(encapsulated_data.response_body) == altered_body
+    assert encapsulated_data.response_header == make_response_header(
+        content_encoding=b'gzip',
+        content_length=len(encapsulated_data.response_body)
+    )
+
+
+def test_body_is_left_decoded_when_content_encoding_is_removed():
+    encapsulated_data = restore_response_body_encoding(
+        encapsulated_data=make_decoded_encapsulated_data(
+            response_header=make_response_header(content_encoding=None, content_length=len(ENCODED_BODY))
+        ),
+        content_was_altered=True
+    )
+
+    assert encapsulated_data.response_body == BODY
+    assert encapsulated_data.response_header == make_response_header(content_encoding=None, content_length=len(BODY))
+
+
+def test_body_is_encoded_with_replaced_content_encoding():
+    encapsulated_data = restore_response_body_encoding(
+        encapsulated_data=make_decoded_encapsulated_data(
+            response_header=make_response_header(content_encoding=b'deflate', content_length=len(ENCODED_BODY))
+        ),
+        content_was_altered=True
+    )
+
+    assert zlib_decompress(encapsulated_data.response_body) == BODY
+    assert encapsulated_data.response_header == make_response_header(
+        content_encoding=b'deflate',
+        content_length=len(encapsulated_data.response_body)
+    )
+
+
+def test_data_without_decoded_body_is_returned_as_is():
+    encapsulated_data = EncapsulatedData(
+        response_header=make_response_header(content_encoding=b'gzip', content_length=len(ENCODED_BODY)),
+        response_body=ENCODED_BODY
+    )
+
+    assert restore_response_body_encoding(
+        encapsulated_data=encapsulated_data,
+        content_was_altered=True
+    ) is encapsulated_data
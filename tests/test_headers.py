@@ -0,0 +1,80 @@
+from icap_server.structures.headers import Headers
+
+
+def test_lookup_is_case_insensitive():
+    headers = Headers([(b'Content-Type', b'text/html'), (b'X-Foo', b'a')])
+
+    assert headers[b'content-type'] == [b'text/html']
+    assert headers.get(b'CONTENT-TYPE') == [b'text/html']
+    assert headers.get_one(b'x-foo') == b'a'
+    assert b'x-FOO' in headers
+    assert b'X-Bar' not in headers
+    assert headers.get(b'X-Bar') is None
+
+
+def test_values_of_repeated_headers_are_kept_in_order():
+    headers = Headers()
+    headers.add(name=b'Via', value=b'1.1 a')
+    headers.add(name=b'via', value=b'1.1 b')
+    headers.extend(name=b'VIA', values=[b'1.1 c'])
+
+    assert headers[b'Via'] == [b'1.1 a', b'1.1 b', b'1.1 c']
+    assert len(headers) == 1
+
+
+def test_first_spelling_is_kept():
+    headers = Headers()
+    headers.add(name=b'x-custom-header', value=b'a')
+    headers.add(name=b'X-Custom-Header', value=b'b')
+    headers.add(name=b'istag', value=b'"1"')
+    headers.add(name=b'Preview', value=b'0')
+
+    assert list(headers) == [b'x-custom-header', b'istag', b'Preview']
+
+
+def test_setitem_replaces_values_and_spelling():
+    headers = Headers([(b'x-foo', b'a')])
+    headers[b'X-Foo'] = [b'b']
+
+    assert list(headers.items()) == [(b'X-Foo', [b'b'])]
+
+
+def test_setdefault_returns_the_stored_list():
+    headers = Headers()
+    headers.setdefault(b'X-Foo', []).append(b'a')
+    headers.setdefault(b'x-foo', []).append(b'b')
+
+    assert headers[b'X-Foo'] == [b'a', b'b']
+
+
+def test_update():
+    headers = Headers([(b'Host', b'a')])
+    headers.update({b'host': [b'b'], b'X-Foo': [b'c']})
+
+    assert headers == {b'Host': [b'b'], b'x-foo': [b'c']}
+
+
+def test_delete():
+    headers = Headers([(b'X-Foo', b'a'), (b'Host', b'b')])
+    del headers[b'x-foo']
+
+    assert list(headers) == [b'Host']
+
+
+def test_items_is_a_view():
+    headers = Headers([(b'Host', b'a'), (b'X-Foo', b'b'), (b'X-Foo', b'c')])
+    items = headers.items()
+
+    assert len(items) == 2
+    assert (b'X-Foo', [b'b', b'c']) in items
+    assert list(items) == [(b'Host', [b'a']), (b'X-Foo', [b'b', b'c'])]
+
+    headers.add(name=b'Allow', value=b'204')
+    assert len(items) == 3
+
+
+def test_bytes():
+    headers = Headers([(b'Host', b'a'), (b'x-foo', b'b'), (b'X-FOO', b'c'), (b'ISTAG', b'"1"')])
+
+    assert bytes(headers) == b'Host: a\r\nx-foo: b\r\nx-foo: c\r\nISTAG: "1"\r\n'
+    assert bytes(Headers()) == b''